@@ -0,0 +1,162 @@
+"""
+Non-blocking logging and the per-request access log.
+
+configure_logging() routes every log record through an in-memory queue to a
+single writer thread, so request threads never block on stdout. When the
+queue is full (the writer cannot keep up) records are dropped and counted
+rather than stalling requests.
+
+init_access_log() writes one JSON line per request when its response has
+been sent:
+
+    {"ts": ..., "method": "GET", "route": "/chat", "status": 200,
+     "latency_ms": 12.3, "user_id": 7, "bytes": 5120}
+
+Routes listed in ACCESS_LOG_SAMPLE_RATES (by URL rule, e.g.
+"/chat/turns/<turn_id>") are logged for that fraction of requests only;
+sampled lines carry "sample_rate" so counts can be scaled back up. Server
+errors and requests slower than ACCESS_LOG_SLOW_MS are always logged.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, request
+from flask_login import current_user
+
+from config import Config
+
+ACCESS_LOGGER = 'moreai.access'
+
+access_logger = logging.getLogger(ACCESS_LOGGER)
+# Access lines are JSON only; keep them out of the root logger's text format
+access_logger.propagate = False
+
+_listener = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LineFormatter(logging.Formatter):
+    """Text lines for application logs, raw JSON for access records"""
+
+    def format(self, record):
+        fields = getattr(record, 'access', None)
+        if fields is not None:
+            return json.dumps(fields, ensure_ascii=False, separators=(',', ':'))
+        return super().format(record)
+
+
+def configure_logging(level=None):
+    """Send all logging through a queue to a background writer thread"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(LineFormatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level or Config.LOG_LEVEL)
+    access_logger.handlers = [handler]
+    access_logger.setLevel(logging.INFO)
+
+    _listener = QueueListener(log_queue, stream)
+    _listener.start()
+    # Flush what is still queued when the process exits normally
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def dropped_records():
+    """Records dropped because the writer thread fell behind"""
+    handler = access_logger.handlers[0] if access_logger.handlers else None
+    return getattr(handler, 'dropped', 0)
+
+
+def _should_log(route, status, latency_ms):
+    rate = Config.ACCESS_LOG_SAMPLE_RATES.get(route, 1.0)
+    if rate >= 1.0 or status >= 500 or latency_ms >= Config.ACCESS_LOG_SLOW_MS:
+        return None, True
+    return rate, random.random() < rate
+
+
+def _counting(body, counter):
+    """Pass a streamed body through while counting the bytes sent"""
+    try:
+        for chunk in body:
+            counter[0] += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode('utf-8'))
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def init_access_log(app):
+    """Register the hooks that write one access log line per request"""
+
+    @app.before_request
+    def start_access_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_access(response):
+        started = g.get('request_started', time.perf_counter())
+        fields = {
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule is not None else None,
+            'status': response.status_code,
+            'user_id': current_user.id if current_user.is_authenticated else None,
+        }
+        counter = None
+        if response.content_length is None and response.is_streamed and not response.direct_passthrough:
+            counter = [0]
+            response.response = _counting(response.response, counter)
+
+        def write_line():
+            # Runs when the server closes the response, so latency and bytes
+            # cover the whole body, including streams
+            latency_ms = (time.perf_counter() - started) * 1000
+            rate, keep = _should_log(fields['route'], fields['status'], latency_ms)
+            if not keep:
+                return
+            line = {
+                'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                **fields,
+                'latency_ms': round(latency_ms, 1),
+                'bytes': counter[0] if counter is not None else response.content_length,
+            }
+            if rate is not None:
+                line['sample_rate'] = rate
+            access_logger.info('access', extra={'access': line})
+
+        if response.direct_passthrough:
+            # Files go straight to the server's file wrapper, which never
+            # closes the response
+            write_line()
+        else:
+            response.call_on_close(write_line)
+        return response
@@ -0,0 +1,108 @@
+"""
+Hot/cold tiering of chat messages.
+
+User and assistant messages older than CHAT_ARCHIVE_AFTER_DAYS move from
+chats to chats_archive in bounded batches, so the hot table and its indexes
+only grow with recent activity. A message is only moved once nothing reads
+it from the hot table any more:
+
+- it is folded into the user's conversation summary (id <= covered_until_id),
+  so building the model context never needs it
+- the user's journal has covered it (id <= last_chat_id), or the user has
+  no journal watermark and so is only journaled from the current day
+
+Journal entries (message_type 'log') stay in chats. Paging back past the
+hot table reads the archive (see history_cache.load_older).
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, or_, select
+
+from config import Config
+from models import db, Chat, ChatArchive, ConversationSummary, JournalWatermark
+import history_cache
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = ('id', 'user_id', 'message', 'timestamp', 'message_type', 'message_hash')
+
+
+def archivable_chats(cutoff, limit):
+    """Up to `limit` (id, user_id) of messages that can move to the archive, oldest first"""
+    return db.session.query(Chat.id, Chat.user_id).join(
+        ConversationSummary, ConversationSummary.user_id == Chat.user_id
+    ).outerjoin(
+        JournalWatermark, JournalWatermark.user_id == Chat.user_id
+    ).filter(
+        Chat.timestamp < cutoff,
+        Chat.message_type.in_(history_cache.CHAT_TYPES),
+        Chat.id <= ConversationSummary.covered_until_id,
+        or_(JournalWatermark.user_id.is_(None), Chat.id <= JournalWatermark.last_chat_id),
+        # SQLite hands out max(id) + 1 to new rows; keeping the newest row
+        # means an archived id is never reused
+        Chat.id < select(func.max(Chat.id)).scalar_subquery()
+    ).order_by(Chat.id).limit(limit).all()
+
+
+def archive_old_chats(batch_size=None, cutoff=None):
+    """
+    Move archivable messages older than cutoff to chats_archive, batch_size
+    rows per transaction.
+
+    Must be called inside an application context. Returns the number of
+    messages moved.
+    """
+    batch_size = batch_size or Config.CHAT_ARCHIVE_BATCH_SIZE
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=Config.CHAT_ARCHIVE_AFTER_DAYS)
+    moved = 0
+    while True:
+        rows = archivable_chats(cutoff, batch_size)
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        columns = [getattr(Chat, name) for name in ARCHIVED_COLUMNS]
+        try:
+            # Copy and delete in one transaction, so a failed batch moves nothing
+            db.session.execute(insert(ChatArchive).from_select(
+                list(ARCHIVED_COLUMNS) + ['archived_at'],
+                select(*columns, db.literal(datetime.utcnow())).where(Chat.id.in_(ids))
+            ))
+            db.session.query(Chat).filter(Chat.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        # Bulk statements skip the session events the history cache listens to
+        for user_id in {row.user_id for row in rows}:
+            history_cache.cache.invalidate(user_id)
+        moved += len(ids)
+        metrics.CHATS_ARCHIVED.inc(len(ids))
+        if len(ids) < batch_size:
+            break
+        # Let request writers take the database lock between batches
+        time.sleep(Config.CHAT_ARCHIVE_BATCH_PAUSE)
+    return moved
+
+
+def chat_archiver(app):
+    """Background loop that runs archive_old_chats every CHAT_ARCHIVE_INTERVAL seconds"""
+    while True:
+        try:
+            with app.app_context():
+                moved = archive_old_chats()
+                if moved:
+                    logger.info(f"Archived {moved} chat messages")
+        except Exception as e:
+            logger.error(f"Error archiving chat messages: {e}")
+        time.sleep(Config.CHAT_ARCHIVE_INTERVAL)
+
+
+def start_chat_archiver(app):
+    thread = threading.Thread(target=chat_archiver, args=(app,), daemon=True, name='chat-archiver')
+    thread.start()
+    return thread
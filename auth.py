@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify, session, current_app
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash
-from datetime import datetime, timedelta
-import uuid
+from datetime import datetime
 from models import db, User, UserSession
+import user_cache
+from user_sessions import start_session
+from hashing import HashingBusyError
 import re
 
 auth = Blueprint('auth', __name__)
@@ -60,6 +61,8 @@ def register():
             'username': user.username
         }), 201
         
+    except HashingBusyError:
+        raise
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Registration error: {str(e)}")
@@ -83,31 +86,23 @@ def login():
     # Find user by username
     user = User.query.filter_by(username=username).first()
     
-    if not user or not user.check_password(password):
+    # A hash made with outdated parameters is replaced and committed below
+    if not user or not user.check_password_for_login(password):
         return jsonify({'error': 'Invalid username or password'}), 401
     
     if not user.is_active:
         return jsonify({'error': 'Account is deactivated'}), 403
     
-    # Create session
-    session_id = str(uuid.uuid4())
-    session_expiry = datetime.utcnow() + timedelta(hours=24 if remember else 1)
-    
-    user_session = UserSession(
-        id=session_id,
-        user_id=user.id,
-        expires_at=session_expiry,
-        ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent')
-    )
-    
     try:
-        db.session.add(user_session)
+        # Create session
+        user_session = start_session(user.id, remember=remember)
         user.last_login = datetime.utcnow()
         db.session.commit()
         
         # Login user with Flask-Login
         login_user(user, remember=remember)
+        # Checked on every request (see user_sessions.py)
+        session['session_id'] = user_session.id
         
         return jsonify({
             'message': 'Login successful',
@@ -115,8 +110,8 @@ def login():
                 'id': user.id,
                 'username': user.username
             },
-            'session_id': session_id,
-            'expires_at': session_expiry.isoformat()
+            'session_id': user_session.id,
+            'expires_at': user_session.expires_at.isoformat()
         }), 200
         
     except Exception as e:
@@ -130,7 +125,11 @@ def logout():
     """User logout endpoint"""
     try:
         # Get session ID from request headers or body
-        session_id = request.headers.get('X-Session-ID') or request.json.get('session_id')
+        session_id = (
+            request.headers.get('X-Session-ID')
+            or (request.get_json(silent=True) or {}).get('session_id')
+            or session.get('session_id')
+        )
         
         if session_id:
             # Deactivate the specific session
@@ -145,7 +144,9 @@ def logout():
                 db.session.commit()
         
         # Logout from Flask-Login
+        user_cache.cache.invalidate(current_user.id)
         logout_user()
+        session.pop('session_id', None)
         
         return jsonify({'message': 'Logout successful'}), 200
         
@@ -174,6 +175,9 @@ def update_profile():
         return jsonify({'error': 'No data provided'}), 400
     
     try:
+        # current_user is a read-only cached snapshot; change the row itself
+        user = db.session.get(User, current_user.id)
+        
         if 'username' in data:
             new_username = data['username'].strip()
             if len(new_username) < 3:
@@ -181,18 +185,18 @@ def update_profile():
             
             # Check if username is already taken by another user
             existing_user = User.query.filter_by(username=new_username).first()
-            if existing_user and existing_user.id != current_user.id:
+            if existing_user and existing_user.id != user.id:
                 return jsonify({'error': 'Username already exists'}), 409
             
-            current_user.username = new_username
+            user.username = new_username
         
         db.session.commit()
         
         return jsonify({
             'message': 'Profile updated successfully',
             'user': {
-                'id': current_user.id,
-                'username': current_user.username
+                'id': user.id,
+                'username': user.username
             }
         }), 200
         
@@ -216,7 +220,9 @@ def change_password():
     if not current_password or not new_password:
         return jsonify({'error': 'Current and new password are required'}), 400
     
-    if not current_user.check_password(current_password):
+    # current_user is a read-only cached snapshot without the password hash
+    user = db.session.get(User, current_user.id)
+    if not user.check_password(current_password):
         return jsonify({'error': 'Current password is incorrect'}), 401
     
     password_valid, password_message = validate_password(new_password)
@@ -224,11 +230,14 @@ def change_password():
         return jsonify({'error': password_message}), 400
     
     try:
-        current_user.set_password(new_password)
+        user.set_password(new_password)
         db.session.commit()
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except HashingBusyError:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Password change error: {str(e)}")
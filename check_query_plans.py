@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Check that the hot queries use their indexes.
+
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for each query below against
+DATABASE_URL and fails if the plan does not use the expected index, or
+sorts rows the index should already return in order. Run it after
+`flask db upgrade` and when changing these queries:
+
+    python check_query_plans.py
+
+The queries mirror load_history_page (server.py), load_older
+(history_cache.py), build_context (context.py), refresh_journal
+(journal.py), the journal page (journal_cache.py), the duplicate message check (turns.py) and the
+session list (auth.py).
+"""
+
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent))
+
+from sqlalchemy import event, func, select
+
+from init_db import create_app
+from models import db, Chat, ChatArchive, UserSession
+
+CHAT_TYPES = ['user', 'assistant']
+NOW = datetime.utcnow()
+
+# (name, statement, indexes the plan may use, whether the index must also provide the order)
+HOT_QUERIES = [
+    (
+        'history page, newest',
+        select(Chat).where(Chat.user_id == 1, Chat.message_type.in_(CHAT_TYPES))
+        .order_by(Chat.id.desc()).limit(51),
+        ('ix_chats_user_id_id',), True
+    ),
+    (
+        'history page, older',
+        select(Chat).where(Chat.user_id == 1, Chat.message_type.in_(CHAT_TYPES), Chat.id < 1000)
+        .order_by(Chat.id.desc()).limit(51),
+        ('ix_chats_user_id_id',), True
+    ),
+    (
+        'history page, archived',
+        select(ChatArchive).where(
+            ChatArchive.user_id == 1, ChatArchive.message_type.in_(CHAT_TYPES), ChatArchive.id < 1000
+        ).order_by(ChatArchive.id.desc()).limit(51),
+        ('ix_chats_archive_user_id_id',), True
+    ),
+    (
+        'model context and journal refresh',
+        select(Chat).where(Chat.user_id == 1, Chat.id > 100, Chat.message_type.in_(CHAT_TYPES))
+        .order_by(Chat.id),
+        ('ix_chats_user_id_id',), True
+    ),
+    (
+        'journal entries',
+        select(Chat.message, Chat.timestamp).where(Chat.user_id == 1, Chat.message_type == 'log')
+        .order_by(Chat.timestamp.desc()).offset(30).limit(31),
+        ('ix_chats_user_type_timestamp',), True
+    ),
+    (
+        'journal validators',
+        select(func.max(Chat.id), func.count(Chat.id), func.max(Chat.timestamp))
+        .where(Chat.user_id == 1, Chat.message_type == 'log'),
+        ('ix_chats_user_type_timestamp',), False
+    ),
+    (
+        'duplicate message check',
+        select(Chat.id).where(
+            Chat.user_id == 1,
+            Chat.message_hash == Chat.hash_message('hello'),
+            Chat.message_type == 'user',
+            Chat.timestamp >= NOW - timedelta(seconds=30)
+        ).limit(1),
+        # Both are bounded: the user's rows with this hash, or their last 30 seconds of messages
+        ('ix_chats_user_message_hash', 'ix_chats_user_type_timestamp'), False
+    ),
+    (
+        'active sessions',
+        select(UserSession).where(
+            UserSession.user_id == 1,
+            UserSession.is_active.is_(True),
+            UserSession.expires_at > NOW
+        ),
+        ('ix_user_sessions_user_active_expires',), False
+    ),
+]
+
+
+@contextmanager
+def explaining(connection):
+    """Prefix every statement run on connection with EXPLAIN"""
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+
+    def add_explain(conn, cursor, statement, parameters, context, executemany):
+        return prefix + statement, parameters
+
+    event.listen(connection, 'before_cursor_execute', add_explain, retval=True)
+    try:
+        yield
+    finally:
+        event.remove(connection, 'before_cursor_execute', add_explain)
+
+
+def query_plan(connection, statement):
+    with explaining(connection):
+        rows = connection.execute(statement).all()
+    # SQLite: (id, parent, notused, detail); PostgreSQL: one text column
+    return [str(row[-1]) for row in rows]
+
+
+def check_plan(dialect, plan, indexes, ordered):
+    """Return the index used, and a problem description or None if the plan is as expected"""
+    text = '\n'.join(plan)
+    used = next((index for index in indexes if index in text), None)
+    if used is None:
+        return None, f"does not use {' or '.join(indexes)}"
+    if ordered and ('TEMP B-TREE' in text if dialect == 'sqlite' else 'Sort' in text):
+        return used, f"uses {used} but sorts the result"
+    return used, None
+
+
+def main():
+    app = create_app()
+    failures = 0
+    with app.app_context():
+        with db.engine.connect() as connection:
+            dialect = connection.dialect.name
+            if dialect == 'postgresql':
+                # Small or empty tables are cheaper to scan; ask for the plan
+                # the planner would use at production sizes
+                connection.exec_driver_sql('SET enable_seqscan = off')
+            for name, statement, indexes, ordered in HOT_QUERIES:
+                plan = query_plan(connection, statement)
+                index, problem = check_plan(dialect, plan, indexes, ordered)
+                if problem:
+                    failures += 1
+                    print(f"FAIL {name}: {problem}")
+                    for line in plan:
+                        print(f"     {line}")
+                else:
+                    print(f"ok   {name}: {index}")
+    if failures:
+        print(f"\n{failures} of {len(HOT_QUERIES)} hot queries do not use their index.")
+        sys.exit(1)
+    print(f"\nAll {len(HOT_QUERIES)} hot queries use their index.")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,146 @@ class Config:
         'sqlite:///moreai.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Database engine profiles (see database.py)
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE', 'auto')  # auto (by URL scheme), sqlite, postgresql or default
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')  # safe with WAL; a crash loses at most the last commits
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # ms a writer waits for the lock
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024))  # pages, or KiB when negative
+    POSTGRES_POOL_SIZE = int(os.environ.get('POSTGRES_POOL_SIZE', 10))
+    POSTGRES_MAX_OVERFLOW = int(os.environ.get('POSTGRES_MAX_OVERFLOW', 10))
+    POSTGRES_POOL_TIMEOUT = int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+    POSTGRES_POOL_RECYCLE = int(os.environ.get('POSTGRES_POOL_RECYCLE', 1800))  # seconds
+    POSTGRES_CONNECT_TIMEOUT = int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', 5))  # seconds
+    POSTGRES_STATEMENT_TIMEOUT = int(os.environ.get('POSTGRES_STATEMENT_TIMEOUT', 15000))  # ms
+    POSTGRES_LOCK_TIMEOUT = int(os.environ.get('POSTGRES_LOCK_TIMEOUT', 5000))  # ms
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = 3600  # 1 hour in seconds
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
     SESSION_COOKIE_HTTPONLY = True
-    SESSION_COOKIE_SAMESITE = 'Lax' 
\ No newline at end of file
+    SESSION_COOKIE_SAMESITE = 'Lax'
+    REMEMBER_COOKIE_DURATION = int(os.environ.get('REMEMBER_COOKIE_DURATION', 30 * 86400))  # seconds; also the lifetime of "remember me" sessions
+    
+    # OpenAI gateway configuration (see gateway.py)
+    OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10))
+    OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get('OPENAI_KEEPALIVE_EXPIRY', 60))
+    OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+    OPENAI_TIMEOUTS = {  # read timeouts per operation, in seconds
+        'chat': float(os.environ.get('OPENAI_CHAT_TIMEOUT', 30)),
+        'journal': float(os.environ.get('OPENAI_JOURNAL_TIMEOUT', 60)),
+        'tts': float(os.environ.get('OPENAI_TTS_TIMEOUT', 30)),
+        'stt': float(os.environ.get('OPENAI_STT_TIMEOUT', 30)),
+    }
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 2))
+    OPENAI_RETRY_BASE_DELAY = float(os.environ.get('OPENAI_RETRY_BASE_DELAY', 0.5))
+    OPENAI_RETRY_MAX_DELAY = float(os.environ.get('OPENAI_RETRY_MAX_DELAY', 4))
+    OPENAI_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('OPENAI_BREAKER_FAILURE_THRESHOLD', 5))
+    OPENAI_BREAKER_RESET_TIMEOUT = float(os.environ.get('OPENAI_BREAKER_RESET_TIMEOUT', 30))
+    
+    # Chat context budget (see context.py)
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 4000))
+    CONTEXT_KEEP_TOKENS = int(os.environ.get('CONTEXT_KEEP_TOKENS', 2000))  # recent turns kept after a summary checkpoint
+    
+    # Chat history pagination
+    CHAT_PAGE_SIZE = int(os.environ.get('CHAT_PAGE_SIZE', 50))
+    CHAT_PAGE_SIZE_MAX = int(os.environ.get('CHAT_PAGE_SIZE_MAX', 200))
+    
+    # Full-text search (see search.py)
+    SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+    SEARCH_PAGE_SIZE_MAX = int(os.environ.get('SEARCH_PAGE_SIZE_MAX', 50))
+    SEARCH_MAX_PAGES = int(os.environ.get('SEARCH_MAX_PAGES', 10))  # deeper pages cost a ranked scan of every match before them
+    SEARCH_MAX_TERMS = int(os.environ.get('SEARCH_MAX_TERMS', 8))  # extra words in a query are ignored
+    SEARCH_SNIPPET_WORDS = int(os.environ.get('SEARCH_SNIPPET_WORDS', 16))  # at most 64 on SQLite
+    
+    # Per-user conversation cache (see history_cache.py)
+    HISTORY_CACHE_MAX_USERS = int(os.environ.get('HISTORY_CACHE_MAX_USERS', 1000))
+    HISTORY_CACHE_MAX_BYTES = int(os.environ.get('HISTORY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    HISTORY_CACHE_TTL = int(os.environ.get('HISTORY_CACHE_TTL', 600))  # seconds
+    HISTORY_CACHE_MAX_MESSAGES = int(os.environ.get('HISTORY_CACHE_MAX_MESSAGES', 200))  # per user, beyond the context window
+    
+    # Chat archival (see archive.py)
+    CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', 90))  # 0 disables archival
+    CHAT_ARCHIVE_INTERVAL = int(os.environ.get('CHAT_ARCHIVE_INTERVAL', 3600))  # seconds between runs
+    CHAT_ARCHIVE_BATCH_SIZE = int(os.environ.get('CHAT_ARCHIVE_BATCH_SIZE', 1000))  # messages per transaction
+    CHAT_ARCHIVE_BATCH_PAUSE = float(os.environ.get('CHAT_ARCHIVE_BATCH_PAUSE', 0.5))  # seconds between batches
+    
+    # Password hashing (see hashing.py)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # werkzeug method string; changing it rehashes on login
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # worker processes
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', 32))  # running + waiting hashes before 503
+    PASSWORD_HASH_TIMEOUT = int(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))  # seconds
+    
+    # Logged-in user identity cache (see user_cache.py)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # seconds; bounds staleness across processes
+    USER_CACHE_MAX_USERS = int(os.environ.get('USER_CACHE_MAX_USERS', 10000))
+    
+    # Server-side login sessions (see user_sessions.py)
+    SESSION_IDLE_TIMEOUT = int(os.environ.get('SESSION_IDLE_TIMEOUT', 3600))  # seconds without a request before a session expires
+    SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 30))  # seconds; revocation delay in other processes
+    SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 10000))
+    SESSION_SWEEP_INTERVAL = int(os.environ.get('SESSION_SWEEP_INTERVAL', 3600))  # seconds
+    SESSION_SWEEP_BATCH_SIZE = int(os.environ.get('SESSION_SWEEP_BATCH_SIZE', 500))
+    
+    # Chat turn execution (see turns.py)
+    CHAT_WORKERS = int(os.environ.get('CHAT_WORKERS', 8))  # concurrent upstream chat calls
+    CHAT_QUEUE_LIMIT = int(os.environ.get('CHAT_QUEUE_LIMIT', 64))  # running + queued turns before 503
+    CHAT_TURN_RESULT_TTL = int(os.environ.get('CHAT_TURN_RESULT_TTL', 300))  # seconds a finished turn stays pollable
+    CHAT_TURN_WAIT_TIMEOUT = int(os.environ.get('CHAT_TURN_WAIT_TIMEOUT', 90))  # legacy /chat?usertext= wait
+    WAITRESS_THREADS = int(os.environ.get('WAITRESS_THREADS', 8))
+    
+    # Nightly journal generation (see journal.py)
+    JOURNAL_WORKERS = int(os.environ.get('JOURNAL_WORKERS', 4))  # concurrent log generations
+    JOURNAL_RETRY_INTERVAL = int(os.environ.get('JOURNAL_RETRY_INTERVAL', 900))  # seconds before a run with failed users is retried
+    
+    # Journal page cache (see journal_cache.py)
+    JOURNAL_PAGE_SIZE = int(os.environ.get('JOURNAL_PAGE_SIZE', 30))  # entries per /journal page
+    JOURNAL_CACHE_TTL = int(os.environ.get('JOURNAL_CACHE_TTL', 3600))  # seconds; bounds staleness across processes
+    JOURNAL_CACHE_MAX_USERS = int(os.environ.get('JOURNAL_CACHE_MAX_USERS', 1000))
+    
+    # Text-to-speech disk cache (see speech.py)
+    TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'tts_cache')  # outside static/, served only via /tts
+    TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    TTS_CACHE_MAX_AGE = int(os.environ.get('TTS_CACHE_MAX_AGE', 86400))  # browser cache lifetime, seconds
+    TTS_WORKERS = int(os.environ.get('TTS_WORKERS', 4))  # concurrent sentence syntheses
+    TTS_CHUNK_MAX_CHARS = int(os.environ.get('TTS_CHUNK_MAX_CHARS', 300))
+    TTS_CHUNKS_PER_REPLY = int(os.environ.get('TTS_CHUNKS_PER_REPLY', 2))  # sentences of one reply synthesized at once
+    
+    # Logging (see access_log.py)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # records waiting for the writer thread; more are dropped
+    ACCESS_LOG_SLOW_MS = int(os.environ.get('ACCESS_LOG_SLOW_MS', 1000))  # slower requests are always logged
+    ACCESS_LOG_SAMPLE_RATES = {  # fraction of requests logged per URL rule, as "rule=rate,..."
+        rule: float(rate) for rule, rate in (
+            item.rsplit('=', 1) for item in os.environ.get(
+                'ACCESS_LOG_SAMPLE_RATES',
+                '/chat/turns/<turn_id>=0.05,/health=0.1,/health/live=0.01,/health/ready=0.01,/health/queue=0.1,/static/<path:filename>=0.1,/metrics=0.1'
+            ).split(',') if item.strip()
+        )
+    }
+    
+    # Health probes (see health.py)
+    HEALTH_STATS_INTERVAL = int(os.environ.get('HEALTH_STATS_INTERVAL', 600))  # seconds between table recounts for /health
+    
+    # Prometheus scrape endpoint (see metrics.py)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # required as "Authorization: Bearer <token>" when set; open when unset
+    
+    # Speech-to-text uploads (see speech.py)
+    STT_MAX_BYTES = int(os.environ.get('STT_MAX_BYTES', 10 * 1024 * 1024))
+    STT_MAX_DURATION = int(os.environ.get('STT_MAX_DURATION', 120))  # seconds, as declared by the client
+    STT_SPOOL_MAX_MEMORY = int(os.environ.get('STT_SPOOL_MAX_MEMORY', 1024 * 1024))  # larger uploads spill to a temp file
+    
+    # Real-time Socket.IO channel (see realtime.py). Waitress cannot upgrade to
+    # WebSocket, so when this is enabled start.sh serves the app with gunicorn
+    # (see gunicorn.conf.py) instead.
+    REALTIME_ENABLED = os.environ.get('REALTIME_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    REALTIME_THREADS = int(os.environ.get('REALTIME_THREADS', 100))  # gunicorn threads; each WebSocket holds one
+    SOCKETIO_TRANSPORTS = os.environ.get('SOCKETIO_TRANSPORTS', 'websocket').split(',')  # add 'polling' only with spare server threads
+    SOCKET_MAX_CONNECTIONS_PER_USER = int(os.environ.get('SOCKET_MAX_CONNECTIONS_PER_USER', 3))
+    SOCKET_MESSAGES_PER_MINUTE = int(os.environ.get('SOCKET_MESSAGES_PER_MINUTE', 20))  # per connection
+    SOCKET_AUDIO_WINDOW = int(os.environ.get('SOCKET_AUDIO_WINDOW', 4))  # unacknowledged audio chunks per turn
+    SOCKET_ACK_TIMEOUT = int(os.environ.get('SOCKET_ACK_TIMEOUT', 30))  # seconds to wait for a chunk acknowledgement
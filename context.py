@@ -0,0 +1,117 @@
+"""
+Token-budgeted conversation context for chat completions.
+
+Only the turns after the user's summary checkpoint are sent verbatim. When
+they outgrow the budget, the oldest ones are folded into a rolling summary
+and the checkpoint moves forward. Between checkpoints the message prefix
+(system prompt, summary, older turns) stays identical, which keeps upstream
+prompt caching effective.
+"""
+
+import logging
+from collections import namedtuple
+from functools import lru_cache
+
+from config import Config
+from models import db, Chat, ConversationSummary
+from more import SYSTEM_PROMPT, summarize_history
+import history_cache
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-message framing cost of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+ConversationContext = namedtuple('ConversationContext', ['summary', 'history'])
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """Load the tokenizer once; None means fall back to an estimate"""
+    try:
+        import tiktoken
+        # The Docker image ships this encoding in TIKTOKEN_CACHE_DIR; elsewhere
+        # tiktoken downloads it on first use
+        return tiktoken.encoding_for_model("gpt-4o-mini")
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, estimating token counts: {e}")
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    """Count tokens in text, caching results for repeated history messages"""
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text.encode('utf-8')) // 4 + 1
+    return len(tokenizer.encode(text))
+
+
+def message_tokens(msg):
+    return count_tokens(msg['message']) + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_context(user_id, inputtext):
+    """
+    Build the summary and recent history to send with inputtext.
+
+    Advances the summary checkpoint (one summarization call) only when the
+    unsummarized turns no longer fit in CONTEXT_TOKEN_BUDGET.
+    """
+    cached = history_cache.get_state(user_id)
+    summary = cached.summary
+    covered_until_id = cached.covered_until_id
+    history = cached.messages_after(covered_until_id)
+    if history is None:
+        chats = Chat.query.filter(
+            Chat.user_id == user_id,
+            Chat.id > covered_until_id,
+            Chat.message_type.in_(['user', 'assistant'])
+        ).order_by(Chat.id).all()
+        history = [{'id': chat.id, 'message': chat.message, 'type': chat.message_type} for chat in chats]
+
+    fixed_tokens = (
+        count_tokens(SYSTEM_PROMPT)
+        + count_tokens(summary)
+        + count_tokens(inputtext)
+        + 3 * MESSAGE_OVERHEAD_TOKENS
+    )
+    window_tokens = sum(message_tokens(msg) for msg in history)
+    if fixed_tokens + window_tokens <= Config.CONTEXT_TOKEN_BUDGET:
+        return ConversationContext(summary, history)
+
+    # Checkpoint: keep the newest turns within CONTEXT_KEEP_TOKENS and fold the
+    # rest, leaving room for the window to grow before the next checkpoint.
+    keep_from = len(history)
+    kept_tokens = 0
+    while keep_from > 0 and kept_tokens + message_tokens(history[keep_from - 1]) <= Config.CONTEXT_KEEP_TOKENS:
+        keep_from -= 1
+        kept_tokens += message_tokens(history[keep_from])
+    # Start the kept window on a user turn
+    while keep_from < len(history) and history[keep_from]['type'] != 'user':
+        keep_from += 1
+    folded, history = history[:keep_from], history[keep_from:]
+    if not folded:
+        return ConversationContext(summary, history)
+
+    new_summary = summarize_history(summary, folded)
+    if new_summary is None:
+        # Keep the old checkpoint and retry at the next turn; this call just
+        # goes out without the folded turns.
+        return ConversationContext(summary, history)
+
+    try:
+        state = db.session.get(ConversationSummary, user_id)
+        if state is None:
+            state = ConversationSummary(user_id=user_id)
+            db.session.add(state)
+        state.summary = new_summary
+        state.covered_until_id = folded[-1]['id']
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error saving conversation summary for user {user_id}: {e}")
+
+    return ConversationContext(new_summary, history)
@@ -0,0 +1,117 @@
+"""
+Database engine profiles.
+
+The profile picks engine options suited to the database behind
+DATABASE_URL (DB_ENGINE_PROFILE=auto chooses by URL scheme):
+
+    sqlite       WAL journal so readers never wait for the writer,
+                 synchronous=NORMAL, a busy timeout instead of immediate
+                 "database is locked" errors, mmap and a larger page cache,
+                 all set with PRAGMAs on every new connection
+    postgresql   bounded connection pool with pre-ping and recycling, and
+                 server-side statement and lock timeouts
+    default      SQLAlchemy defaults
+
+Every value comes from Config and can be overridden from the environment.
+
+The schema is versioned with Alembic migrations in migrations/ (run through
+Flask-Migrate); upgrade_schema() applies them at startup.
+"""
+
+import os
+
+from flask_migrate import Migrate, stamp, upgrade
+from sqlalchemy import event
+
+from config import Config
+from models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# The revision matching the tables db.create_all() built before migrations
+BASELINE_REVISION = 'ac3c6d7577a8'
+
+migrate = Migrate()
+
+
+def resolve_profile(uri, profile=None):
+    """Profile name for a database URL: 'sqlite', 'postgresql' or 'default'"""
+    profile = profile or Config.DB_ENGINE_PROFILE
+    if profile != 'auto':
+        return profile
+    scheme = uri.split(':', 1)[0].split('+', 1)[0]
+    if scheme == 'sqlite':
+        return 'sqlite'
+    if scheme in ('postgresql', 'postgres'):
+        return 'postgresql'
+    return 'default'
+
+
+def engine_options(uri, profile=None):
+    """SQLALCHEMY_ENGINE_OPTIONS for the profile of uri"""
+    profile = resolve_profile(uri, profile)
+    if profile == 'sqlite':
+        # sqlite3's own lock wait; the busy_timeout PRAGMA below sets the same
+        return {'connect_args': {'timeout': Config.SQLITE_BUSY_TIMEOUT / 1000}}
+    if profile == 'postgresql':
+        return {
+            'pool_size': Config.POSTGRES_POOL_SIZE,
+            'max_overflow': Config.POSTGRES_MAX_OVERFLOW,
+            'pool_timeout': Config.POSTGRES_POOL_TIMEOUT,
+            'pool_recycle': Config.POSTGRES_POOL_RECYCLE,
+            'pool_pre_ping': True,
+            'connect_args': {
+                'connect_timeout': Config.POSTGRES_CONNECT_TIMEOUT,
+                'options': (
+                    f"-c statement_timeout={Config.POSTGRES_STATEMENT_TIMEOUT} "
+                    f"-c lock_timeout={Config.POSTGRES_LOCK_TIMEOUT}"
+                )
+            }
+        }
+    return {}
+
+
+def sqlite_pragmas():
+    return {
+        'journal_mode': Config.SQLITE_JOURNAL_MODE,
+        'synchronous': Config.SQLITE_SYNCHRONOUS,
+        'busy_timeout': Config.SQLITE_BUSY_TIMEOUT,
+        'mmap_size': Config.SQLITE_MMAP_SIZE,
+        'cache_size': Config.SQLITE_CACHE_SIZE,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_app(app):
+    """Apply the engine profile and initialize db for app"""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    profile = resolve_profile(uri)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri, profile)
+    db.init_app(app)
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR)
+    if profile == 'sqlite':
+        with app.app_context():
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+    return profile
+
+
+def upgrade_schema():
+    """
+    Apply pending migrations. Must run in an application context, after
+    db.create_all() has created any missing tables.
+
+    A database without an alembic_version table was built by create_all();
+    it is stamped with the baseline revision, and the later migrations skip
+    what create_all() already made.
+    """
+    if 'alembic_version' not in db.inspect(db.engine).get_table_names():
+        stamp(revision=BASELINE_REVISION)
+    upgrade()
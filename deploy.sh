@@ -55,7 +55,7 @@ echo "⏳ Waiting for application to start..."
 sleep 10
 
 # Check if application is running
-if curl -f http://localhost:8000/health > /dev/null 2>&1; then
+if curl -f http://localhost:8000/health/ready > /dev/null 2>&1; then
     echo "✅ MoreAI is running successfully!"
     echo ""
     echo "🌐 Access your application:"
@@ -0,0 +1,240 @@
+"""
+Shared gateway for all OpenAI calls.
+
+Owns a single long-lived client with a pooled keep-alive HTTP connection,
+applies per-operation timeouts, retries transient failures with jittered
+backoff and trips a circuit breaker when the upstream is degraded.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import httpx
+import openai
+from openai import OpenAI
+
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Failures worth retrying: network problems, timeouts, rate limits and 5xx
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls fail fast"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go upstream right now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                # Let exactly one probe through to test the upstream
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """End a call that says nothing about upstream health, e.g. a client error"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+breaker = CircuitBreaker(
+    failure_threshold=Config.OPENAI_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=Config.OPENAI_BREAKER_RESET_TIMEOUT
+)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide OpenAI client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                http_client = openai.DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=Config.OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=Config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=Config.OPENAI_KEEPALIVE_EXPIRY
+                    )
+                )
+                _client = OpenAI(
+                    api_key=Config.OPENAI_API_KEY,
+                    max_retries=0,  # retries are handled here so the breaker sees them
+                    http_client=http_client
+                )
+    return _client
+
+
+def operation_timeout(operation):
+    """Build the httpx timeout for an operation ('chat', 'journal', 'tts' or 'stt')"""
+    return httpx.Timeout(
+        Config.OPENAI_TIMEOUTS.get(operation, Config.OPENAI_TIMEOUTS['chat']),
+        connect=Config.OPENAI_CONNECT_TIMEOUT
+    )
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+    cap = min(Config.OPENAI_RETRY_MAX_DELAY, Config.OPENAI_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def call(operation, fn):
+    """
+    Run fn(client, timeout) with retries and circuit breaking.
+
+    Raises CircuitOpenError without touching the network while the breaker is
+    open; otherwise re-raises the last upstream error once retries run out.
+    """
+    started = time.perf_counter()
+    try:
+        result = _call_with_retries(operation, fn)
+    except Exception as e:
+        metrics.UPSTREAM_ERRORS.inc(operation=operation, error=type(e).__name__)
+        metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, operation=operation, outcome='error')
+        raise
+    metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, operation=operation, outcome='ok')
+    return result
+
+
+def _call_with_retries(operation, fn):
+    client = get_client()
+    timeout = operation_timeout(operation)
+    attempts = Config.OPENAI_MAX_RETRIES + 1
+
+    for attempt in range(attempts):
+        if not breaker.allow():
+            raise CircuitOpenError(f"OpenAI circuit open, skipping {operation} call")
+        try:
+            result = fn(client, timeout)
+        except RETRYABLE_ERRORS:
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                raise
+            time.sleep(backoff_delay(attempt))
+            continue
+        except Exception:
+            # Client errors (bad request, auth, ...) are not an upstream health
+            # signal: neither a failure nor a probe that may close the breaker
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+
+def chat_completion(operation='chat', **kwargs):
+    """Create a chat completion and record its token usage"""
+    response = call(operation, lambda client, timeout: client.chat.completions.create(timeout=timeout, **kwargs))
+    record_usage(operation, getattr(response, 'usage', None))
+    return response
+
+
+def stream_chat_completion(operation='chat', **kwargs):
+    """
+    Open a streaming chat completion.
+
+    Only opening the stream is retried; once tokens are flowing a failure is
+    surfaced to the caller so it never sees duplicated output. The final chunk
+    carries token usage, which the caller should pass to record_usage().
+    """
+    return call(operation, lambda client, timeout: client.chat.completions.create(
+        timeout=timeout,
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs
+    ))
+
+
+def synthesize_speech(**kwargs):
+    """Synthesize speech and return the encoded audio bytes"""
+    return call('tts', lambda client, timeout: client.audio.speech.create(timeout=timeout, **kwargs).content)
+
+
+def transcribe(**kwargs):
+    """Transcribe an audio file"""
+    def _transcribe(client, timeout):
+        # Rewind the upload so a retry sends the whole file again
+        audio = kwargs.get('file')
+        fileobj = audio[1] if isinstance(audio, tuple) else audio
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        return client.audio.transcriptions.create(timeout=timeout, **kwargs)
+
+    return call('stt', _transcribe)
+
+
+def record_usage(operation, usage):
+    """Log token usage for one call and count it in the upstream token metrics"""
+    if usage is None:
+        return
+    details = getattr(usage, 'prompt_tokens_details', None)
+    counts = {
+        'prompt_tokens': usage.prompt_tokens or 0,
+        'cached_tokens': (getattr(details, 'cached_tokens', 0) or 0) if details else 0,
+        'completion_tokens': usage.completion_tokens or 0,
+    }
+    for key, value in counts.items():
+        metrics.UPSTREAM_TOKENS.inc(value, operation=operation, kind=key.replace('_tokens', ''))
+    logger.info(
+        f"Token usage [{operation}]: prompt={counts['prompt_tokens']} "
+        f"cached={counts['cached_tokens']} completion={counts['completion_tokens']}"
+    )
+
+
+def status():
+    """Gateway health summary"""
+    return breaker.snapshot()
@@ -0,0 +1,20 @@
+"""
+gunicorn settings, used by start.sh when REALTIME_ENABLED is set.
+
+A single worker: chat turns, caches and socket connections live in the
+process, and Socket.IO without a message queue needs every client on the
+same one. Each open WebSocket holds one of its threads.
+"""
+
+from config import Config
+
+bind = '0.0.0.0:8000'
+workers = 1
+worker_class = 'gthread'
+threads = Config.REALTIME_THREADS
+
+
+def post_worker_init(worker):
+    # Runs in the worker once server.py is loaded
+    import metrics
+    metrics.SERVER_THREADS.set(worker.cfg.threads, server='gunicorn')
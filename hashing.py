@@ -0,0 +1,127 @@
+"""
+Password hashing on a bounded process pool.
+
+scrypt/pbkdf2 hashing takes tens of milliseconds of CPU and holds the GIL,
+so running it on request threads stalls every other request in the process
+during a login burst. Hashes are computed in PASSWORD_HASH_WORKERS worker
+processes instead; when more than PASSWORD_HASH_QUEUE_LIMIT are waiting,
+new requests are refused with HashingBusyError (served as a 503).
+
+The hash parameters come from PASSWORD_HASH_METHOD. verify_password()
+reports hashes made with other parameters so login can upgrade them.
+
+Workers are forked, all at once, by start_pool() before the server starts
+any threads: forking a multi-threaded process can copy locks held by other
+threads, and spawn would re-run server.py in every worker. For the same
+reason a pool whose worker died is not replaced: hashing fails fast with
+HashingBusyError, and /health/live and /health/ready answer 503 so the
+process gets replaced.
+"""
+
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from config import Config
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing pool is saturated"""
+
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_broken = False
+_pending = 0
+_lock = threading.Lock()
+
+
+def start_pool():
+    """Create the pool and fork its workers; call before starting threads"""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context('fork')
+            )
+            pool = _pool
+        else:
+            return _pool
+    # The fork context launches every worker on the first submit
+    pool.submit(int).result()
+    return pool
+
+
+def _release(future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def is_broken():
+    """True once a worker has died; the pool stays unusable until a restart"""
+    return _broken
+
+
+def _run(fn, *args):
+    global _pending, _broken
+    with _lock:
+        if _broken:
+            raise HashingBusyError("Password hashing is unavailable until the server restarts")
+        if _pending >= Config.PASSWORD_HASH_QUEUE_LIMIT:
+            raise HashingBusyError(f"Password hashing queue is full ({_pending} pending)")
+        _pending += 1
+    try:
+        future = start_pool().submit(fn, *args)
+    except BaseException:
+        _release(None)
+        raise
+    # Counted until the worker is done, even if the caller stops waiting
+    future.add_done_callback(_release)
+    try:
+        return future.result(timeout=Config.PASSWORD_HASH_TIMEOUT)
+    except TimeoutError:
+        raise HashingBusyError("Password hashing timed out")
+    except BrokenProcessPool:
+        # Request threads are running by now, so a replacement pool cannot
+        # be forked safely
+        with _lock:
+            if not _broken:
+                logger.error("A password hashing worker died; hashing is disabled until the server restarts")
+            _broken = True
+        raise HashingBusyError("Password hashing is unavailable until the server restarts")
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # Hash headers spell out every parameter ("scrypt:32768:8:1"), so
+    # compare against a header produced with the configured method
+    return _run(generate_password_hash, '', method).split('$', 1)[0]
+
+
+def hash_password(password):
+    """Hash password with PASSWORD_HASH_METHOD in a worker process"""
+    return _run(generate_password_hash, password, Config.PASSWORD_HASH_METHOD)
+
+
+def verify_password(pwhash, password):
+    """
+    Check password against pwhash in a worker process.
+
+    Returns (valid, needs_rehash); needs_rehash is True when pwhash was made
+    with parameters other than PASSWORD_HASH_METHOD.
+    """
+    valid = _run(_verify, pwhash, password)
+    needs_rehash = valid and pwhash.split('$', 1)[0] != _method_prefix(Config.PASSWORD_HASH_METHOD)
+    return valid, needs_rehash
@@ -0,0 +1,114 @@
+"""
+Health probes and cached table statistics.
+
+Probes must stay cheap however large the tables grow: readiness only runs
+SELECT 1, and the row counts shown by /health are kept in memory. They are
+counted once in the background at startup and every HEALTH_STATS_INTERVAL
+seconds, and adjusted in between from committed inserts and deletes, so a
+probe never scans a table.
+
+Bulk deletes (the session sweeper) and other processes' writes are only
+picked up by the next recount.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import func
+
+from config import Config
+from models import db, User, Chat, UserSession
+from session_events import on_commit
+
+COUNTED_MODELS = {
+    'user_count': User,
+    'chat_count': Chat,
+    'session_count': UserSession,
+}
+
+
+class TableStats:
+    """Row counts per counted model, recounted periodically and adjusted on commit"""
+
+    def __init__(self):
+        self._counts = None
+        self._counted_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Recount every table; must be called inside an application context"""
+        counts = {
+            name: db.session.query(func.count()).select_from(model).scalar()
+            for name, model in COUNTED_MODELS.items()
+        }
+        with self._lock:
+            self._counts = counts
+            self._counted_at = datetime.utcnow()
+
+    def apply(self, deltas):
+        with self._lock:
+            if self._counts is None:
+                return
+            for name, delta in deltas.items():
+                self._counts[name] = max(0, self._counts[name] + delta)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counts': dict(self._counts) if self._counts is not None else None,
+                'counted_at': self._counted_at.isoformat() if self._counted_at else None
+            }
+
+
+logger = logging.getLogger(__name__)
+
+stats = TableStats()
+
+
+def check_database():
+    """Run a trivial query; returns None if the database answered, else the error"""
+    try:
+        with db.engine.connect() as connection:
+            connection.execute(db.text('SELECT 1'))
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def stats_refresher(app):
+    """Background loop that recounts the tables every HEALTH_STATS_INTERVAL seconds"""
+    while True:
+        try:
+            with app.app_context():
+                stats.refresh()
+        except Exception as e:
+            logger.error(f"Error counting table rows: {e}")
+        time.sleep(Config.HEALTH_STATS_INTERVAL)
+
+
+def start_stats_refresher(app):
+    thread = threading.Thread(target=stats_refresher, args=(app,), daemon=True, name='health-stats')
+    thread.start()
+    return thread
+
+
+# --- incremental counts from the ORM session -----------------------------------
+
+def _count_key(obj):
+    for name, model in COUNTED_MODELS.items():
+        if isinstance(obj, model):
+            return name
+    return None
+
+
+def _collect_changes(session, pending):
+    for objects, delta in ((session.new, 1), (session.deleted, -1)):
+        for obj in objects:
+            name = _count_key(obj)
+            if name is not None:
+                pending[name] = pending.get(name, 0) + delta
+
+
+on_commit('health_stats', _collect_changes, stats.apply, factory=dict)
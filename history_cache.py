@@ -0,0 +1,202 @@
+"""
+In-process cache of per-user conversation state.
+
+Each entry holds the user's rolling summary checkpoint and the newest
+user/assistant messages, so a chat turn can build its context and render the
+newest history page without querying the chats table. Entries are kept up to
+date from SQLAlchemy session events: rows are appended when their
+transaction commits and the affected users are dropped on rollback.
+"""
+
+import sys
+from bisect import insort
+
+from config import Config
+from models import db, Chat, ChatArchive, ConversationSummary
+from session_events import on_commit
+from ttl_cache import TTLCache
+
+CHAT_TYPES = ('user', 'assistant')
+
+# Rough per-message bookkeeping cost (dict, keys, timestamp string)
+MESSAGE_OVERHEAD_BYTES = 240
+
+
+class ConversationState:
+    """
+    Cached conversation state for one user.
+
+    Every user/assistant message with id > floor_id is in `messages`
+    (ascending by id); floor_id == 0 means the whole history is cached.
+    Updates replace the messages list instead of mutating it, so readers can
+    use a list they obtained without holding the cache lock.
+    """
+
+    def __init__(self, summary, covered_until_id, messages, floor_id):
+        self.summary = summary
+        self.covered_until_id = covered_until_id
+        self.messages = messages
+        self.floor_id = floor_id
+        self.size = self._measure()
+
+    def _measure(self):
+        size = sys.getsizeof(self.summary or '')
+        for msg in self.messages:
+            size += sys.getsizeof(msg['message']) + MESSAGE_OVERHEAD_BYTES
+        return size
+
+    def add_message(self, msg):
+        if msg['id'] <= self.floor_id or any(m['id'] == msg['id'] for m in self.messages[-8:]):
+            return
+        messages = list(self.messages)
+        insort(messages, msg, key=lambda m: m['id'])
+        self.messages = messages
+        self.size += sys.getsizeof(msg['message']) + MESSAGE_OVERHEAD_BYTES
+        self._trim()
+
+    def _trim(self):
+        # Drop messages nobody needs any more: older than the summary
+        # checkpoint and beyond what the newest history page shows. One
+        # message past the page tells newest_page() whether older ones exist.
+        excess = len(self.messages) - max(Config.HISTORY_CACHE_MAX_MESSAGES, Config.CHAT_PAGE_SIZE + 1)
+        drop = 0
+        while drop < excess and self.messages[drop]['id'] <= self.covered_until_id:
+            self.size -= sys.getsizeof(self.messages[drop]['message']) + MESSAGE_OVERHEAD_BYTES
+            drop += 1
+        if drop:
+            self.floor_id = self.messages[drop - 1]['id']
+            self.messages = self.messages[drop:]
+
+    def messages_after(self, chat_id):
+        """Messages with id > chat_id, or None if some of them are not cached"""
+        if chat_id < self.floor_id:
+            return None
+        return [msg for msg in self.messages if msg['id'] > chat_id]
+
+    def newest_page(self, limit):
+        """The newest `limit` messages and whether older ones exist, or None if unknown"""
+        messages = self.messages
+        if len(messages) > limit:
+            return messages[-limit:], True
+        if self.floor_id == 0:
+            return list(messages), False
+        return None
+
+
+cache = TTLCache(
+    max_entries=Config.HISTORY_CACHE_MAX_USERS,
+    ttl=Config.HISTORY_CACHE_TTL,
+    max_bytes=Config.HISTORY_CACHE_MAX_BYTES,
+    sizeof=lambda state: state.size
+)
+
+
+def chat_to_dict(chat):
+    return {
+        'id': chat.id,
+        'message': chat.message,
+        'type': chat.message_type,
+        'timestamp': chat.timestamp.isoformat()
+    }
+
+
+def load_older(user_id, before_id, limit):
+    """
+    Up to `limit` user/assistant messages with id < before_id (the newest
+    when before_id is None), newest first, as dicts.
+
+    Reads chats_archive once the hot table has no older messages; archived
+    messages are always older than the user's remaining ones (see archive.py).
+    """
+    messages = []
+    for model in (Chat, ChatArchive):
+        query = model.query.filter(model.user_id == user_id, model.message_type.in_(CHAT_TYPES))
+        if before_id is not None:
+            query = query.filter(model.id < before_id)
+        rows = query.order_by(model.id.desc()).limit(limit - len(messages)).all()
+        messages.extend(chat_to_dict(row) for row in rows)
+        if len(messages) >= limit:
+            break
+        if messages:
+            before_id = messages[-1]['id']
+    return messages
+
+
+def load_state(user_id):
+    """Load a user's conversation state from the database"""
+    state = db.session.get(ConversationSummary, user_id)
+    summary = state.summary if state else None
+    covered_until_id = state.covered_until_id if state else 0
+
+    # Everything after the checkpoint is needed for the model context...
+    chats = Chat.query.filter(
+        Chat.user_id == user_id,
+        Chat.id > covered_until_id,
+        Chat.message_type.in_(CHAT_TYPES)
+    ).order_by(Chat.id).all()
+    messages = [chat_to_dict(chat) for chat in chats]
+    floor_id = covered_until_id
+
+    # ...and at least a full newest page is needed for display
+    missing = Config.CHAT_PAGE_SIZE + 1 - len(messages)
+    if missing > 0 and covered_until_id > 0:
+        older = load_older(user_id, covered_until_id + 1, missing)
+        messages = list(reversed(older)) + messages
+        floor_id = older[-1]['id'] - 1 if len(older) == missing else 0
+
+    return ConversationState(summary, covered_until_id, messages, floor_id)
+
+
+def get_state(user_id):
+    """Return the user's cached conversation state, loading it on a miss"""
+    entry = cache.get(user_id)
+    if entry is None:
+        generation = cache.generation(user_id)
+        entry = load_state(user_id)
+        cache.put(user_id, entry, generation)
+    return entry
+
+
+# --- write-through from the ORM session -------------------------------------
+
+def _collect_changes(session, pending):
+    """Remember flushed chat and summary rows until the transaction ends"""
+    for obj in session.new:
+        if isinstance(obj, Chat):
+            pending.append(('chat', obj.user_id, chat_to_dict(obj) if obj.message_type in CHAT_TYPES else None))
+        elif isinstance(obj, ConversationSummary):
+            pending.append(('summary', obj.user_id, (obj.summary, obj.covered_until_id)))
+    for obj in session.dirty:
+        if isinstance(obj, ConversationSummary):
+            pending.append(('summary', obj.user_id, (obj.summary, obj.covered_until_id)))
+        elif isinstance(obj, Chat) and obj.message_type in CHAT_TYPES:
+            pending.append(('invalidate', obj.user_id, None))
+    for obj in session.deleted:
+        if isinstance(obj, ConversationSummary) or (isinstance(obj, Chat) and obj.message_type in CHAT_TYPES):
+            pending.append(('invalidate', obj.user_id, None))
+
+
+def _apply_changes(pending):
+    for kind, user_id, payload in pending:
+        if kind == 'chat':
+            if payload is not None:
+                cache.update(user_id, lambda entry: entry.add_message(payload))
+        elif kind == 'summary':
+            def set_summary(entry, summary=payload[0], covered_until_id=payload[1]):
+                entry.summary = summary
+                entry.covered_until_id = covered_until_id
+                entry.size = entry._measure()
+                entry._trim()
+            cache.update(user_id, set_summary)
+        else:
+            cache.invalidate(user_id)
+
+
+def _discard_changes(pending):
+    # Anything flushed in the rolled-back transaction never happened; drop the
+    # affected users rather than trying to undo partial updates.
+    for _, user_id, _ in pending:
+        cache.invalidate(user_id)
+
+
+on_commit('history_cache', _collect_changes, _apply_changes, _discard_changes, factory=list)
@@ -13,9 +13,9 @@ sys.path.append(str(Path(__file__).parent))
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from config import Config
 from models import db, User
+import database
 from werkzeug.security import generate_password_hash
 
 def create_app():
@@ -23,9 +23,8 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
-    # Initialize extensions
-    db.init_app(app)
-    migrate = Migrate(app, db)
+    # Initialize extensions (db and migrations)
+    database.init_app(app)
     
     return app
 
@@ -36,8 +35,9 @@ def init_database():
     with app.app_context():
         print("Creating database tables...")
         
-        # Create all tables
+        # Create all tables, then record or apply the migrations
         db.create_all()
+        database.upgrade_schema()
         
         print("Database tables created successfully!")
         
@@ -0,0 +1,199 @@
+"""
+Journal generation.
+
+Each user has a watermark (JournalWatermark) recording the last chat message
+already summarized. Generating a journal entry only sends the messages after
+it, plus the previous entry as context. A refresh during the day replaces
+that day's entry rather than adding another one.
+
+The nightly run loads every user's pending messages in one query, generates
+the logs on a bounded worker pool and commits each log together with the
+watermark and the run's progress, so a run that crashes part-way resumes
+with the users it has not done yet.
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import func, or_
+
+from config import Config
+from models import db, Chat, JournalRun, JournalWatermark
+from more import generate_log
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_pending_conversations(day_start, day_end):
+    """
+    Messages not yet covered by each user's watermark and sent before
+    day_end, grouped by user id. Users without a watermark start at day_start.
+    """
+    rows = db.session.query(Chat.id, Chat.user_id, Chat.message, Chat.message_type).outerjoin(
+        JournalWatermark, JournalWatermark.user_id == Chat.user_id
+    ).filter(
+        Chat.id > func.coalesce(JournalWatermark.last_chat_id, 0),
+        Chat.timestamp < day_end,
+        or_(JournalWatermark.user_id.isnot(None), Chat.timestamp >= day_start),
+        Chat.message_type.in_(['user', 'assistant'])
+    ).order_by(Chat.user_id, Chat.id).all()
+
+    conversations = {}
+    for user_id, user_rows in groupby(rows, key=lambda row: row.user_id):
+        conversations[user_id] = [
+            {'id': row.id, 'message': row.message, 'type': row.message_type} for row in user_rows
+        ]
+    return conversations
+
+
+def load_previous_logs(user_ids, batch_size=500):
+    """The current journal entry text for each user that has one"""
+    user_ids = list(user_ids)
+    previous = {}
+    for i in range(0, len(user_ids), batch_size):
+        rows = db.session.query(JournalWatermark.user_id, Chat.message).join(
+            Chat, Chat.id == JournalWatermark.log_chat_id
+        ).filter(JournalWatermark.user_id.in_(user_ids[i:i + batch_size])).all()
+        previous.update({row.user_id: row.message for row in rows})
+    return previous
+
+
+def write_journal_entry(user_id, period, log_entry, last_chat_id):
+    """
+    Store a journal entry for `period` and advance the user's watermark.
+
+    Replaces the entry previously written for the same period. The caller
+    commits.
+    """
+    log_chat = Chat(user_id=user_id, message=log_entry, message_type='log')
+    db.session.add(log_chat)
+    # Insert before deleting the replaced entry so SQLite cannot hand its id
+    # to the new row
+    db.session.flush()
+
+    watermark = db.session.get(JournalWatermark, user_id)
+    if watermark is None:
+        watermark = JournalWatermark(user_id=user_id, last_chat_id=0)
+        db.session.add(watermark)
+    elif watermark.log_date == period and watermark.log_chat_id:
+        old_log = db.session.get(Chat, watermark.log_chat_id)
+        if old_log is not None:
+            db.session.delete(old_log)
+
+    watermark.last_chat_id = max(watermark.last_chat_id or 0, last_chat_id)
+    watermark.log_chat_id = log_chat.id
+    watermark.log_date = period
+    return log_chat
+
+
+def refresh_journal(user_id):
+    """
+    Bring today's journal entry up to date with the user's new messages.
+
+    Returns the new log Chat row, or None if there was nothing new.
+    Raises if the log could not be generated.
+    """
+    watermark = db.session.get(JournalWatermark, user_id)
+    query = Chat.query.filter(Chat.user_id == user_id, Chat.message_type.in_(['user', 'assistant']))
+    if watermark is not None:
+        query = query.filter(Chat.id > watermark.last_chat_id)
+    else:
+        # Like the nightly run, a user without a watermark starts today
+        today_start = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        query = query.filter(Chat.timestamp >= today_start)
+    new_chats = query.order_by(Chat.id).all()
+    if not new_chats:
+        return None
+
+    previous_log = None
+    if watermark is not None and watermark.log_chat_id:
+        previous = db.session.get(Chat, watermark.log_chat_id)
+        previous_log = previous.message if previous else None
+
+    history = [{'message': chat.message, 'type': chat.message_type} for chat in new_chats]
+    log_entry = generate_log(history, previous_log=previous_log)
+
+    try:
+        log_chat = write_journal_entry(user_id, datetime.utcnow().date(), log_entry, new_chats[-1].id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return log_chat
+
+
+def run_daily_journals(run_date):
+    """
+    Create journal logs for every user with unsummarized messages up to the
+    end of run_date (UTC).
+
+    Must be called inside an application context. Does nothing if the run
+    for run_date already completed; resumes it if it was interrupted, and
+    retries its failed users JOURNAL_RETRY_INTERVAL after it finished.
+    Returns the JournalRun.
+    """
+    run = JournalRun.query.filter_by(run_date=run_date).first()
+    if run is not None and run.status == 'completed':
+        return run
+    if run is not None and run.status == 'incomplete' and \
+            datetime.utcnow() - run.finished_at < timedelta(seconds=Config.JOURNAL_RETRY_INTERVAL):
+        return run
+
+    if run is None:
+        run = JournalRun(run_date=run_date, status='running', started_at=datetime.utcnow(), users_done=0)
+        db.session.add(run)
+        db.session.commit()
+    else:
+        logger.info(f"Resuming journal run for {run_date} ({run.users_done}/{run.users_total} users done)")
+
+    started = time.monotonic()
+    day_start = datetime.combine(run_date, datetime.min.time())
+    # Users finished before a crash have their watermark past day_end already
+    pending = fetch_pending_conversations(day_start, day_start + timedelta(days=1))
+    previous_logs = load_previous_logs(pending.keys())
+
+    failures = {}
+    run.users_done = run.users_done or 0
+    run.users_total = run.users_done + len(pending)
+    run.users_failed = 0
+    db.session.commit()
+
+    with ThreadPoolExecutor(max_workers=Config.JOURNAL_WORKERS, thread_name_prefix='journal') as pool:
+        futures = {
+            pool.submit(generate_log, history, previous_logs.get(user_id)): user_id
+            for user_id, history in pending.items()
+        }
+        for future in as_completed(futures):
+            user_id = futures[future]
+            try:
+                write_journal_entry(user_id, run_date, future.result(), pending[user_id][-1]['id'])
+                run.users_done += 1
+                # The log, the watermark and the progress counters commit together
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                failures[str(user_id)] = str(e)
+                run.users_failed += 1
+                if db.session.get(JournalWatermark, user_id) is None:
+                    # Later runs only look at run_date for users without a
+                    # watermark; this one keeps the failed day in their range
+                    db.session.add(JournalWatermark(user_id=user_id, last_chat_id=pending[user_id][0]['id'] - 1))
+                db.session.commit()
+
+    run.status = 'incomplete' if failures else 'completed'
+    run.finished_at = datetime.utcnow()
+    run.duration_seconds = (run.duration_seconds or 0) + time.monotonic() - started
+    run.failures = json.dumps(failures) if failures else None
+    db.session.commit()
+
+    logger.info(
+        f"Daily logs for {run_date}: {run.users_done}/{run.users_total} users "
+        f"in {run.duration_seconds:.1f}s, {run.users_failed} failed"
+    )
+    for user_id, error in failures.items():
+        logger.error(f"Daily log failed for user {user_id}: {error}")
+    return run
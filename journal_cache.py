@@ -0,0 +1,92 @@
+"""
+In-process cache of rendered /journal pages.
+
+Journal entries change at most a few times a day (the nightly run and
+manual refreshes), so each page of a user's journal is rendered once and
+kept as an HTML fragment together with its validators: an ETag built from
+the newest log id and entry count, and Last-Modified from the newest log
+timestamp. A user's pages are dropped when a transaction that writes or
+deletes one of their journal entries commits (see write_journal_entry in
+journal.py); entries written by another process are picked up when
+JOURNAL_CACHE_TTL expires.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+
+from flask import render_template
+from sqlalchemy import func
+
+from config import Config
+from models import db, Chat
+from session_events import on_commit
+from ttl_cache import TTLCache
+
+
+@dataclass(frozen=True)
+class JournalPage:
+    """One rendered page of a user's journal"""
+    html: str
+    etag: str
+    last_modified: datetime
+
+
+# user_id -> {page number: JournalPage}; all of a user's pages expire together
+cache = TTLCache(max_entries=Config.JOURNAL_CACHE_MAX_USERS, ttl=Config.JOURNAL_CACHE_TTL)
+
+
+def render_page(user_id, page, per_page):
+    """Render one page of the user's journal, newest entry first; None if the page is past the end"""
+    newest_id, count, newest_timestamp = db.session.query(
+        func.max(Chat.id), func.count(Chat.id), func.max(Chat.timestamp)
+    ).filter(Chat.user_id == user_id, Chat.message_type == 'log').one()
+
+    # Fetch one extra row to know whether an older page exists
+    logs = db.session.query(Chat.message, Chat.timestamp).filter(
+        Chat.user_id == user_id, Chat.message_type == 'log'
+    ).order_by(Chat.timestamp.desc()).offset((page - 1) * per_page).limit(per_page + 1).all()
+    if page > 1 and not logs:
+        return None
+
+    has_next = len(logs) > per_page
+    journal_entries = [{
+        'content': log.message,
+        'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    } for log in logs[:per_page]]
+    html = render_template(
+        'journal_entries.html', journal_entries=journal_entries, page=page, has_next=has_next
+    )
+    return JournalPage(
+        html=html,
+        etag=f"journal-{user_id}-{newest_id or 0}-{count}-{page}-{per_page}",
+        last_modified=newest_timestamp or datetime(1970, 1, 1)
+    )
+
+
+def load_page(user_id, page):
+    """Return the cached JournalPage, rendering it on a miss; None if the page is past the end"""
+    pages = cache.get(user_id) or {}
+    journal_page = pages.get(page)
+    if journal_page is None:
+        generation = cache.generation(user_id)
+        journal_page = render_page(user_id, page, Config.JOURNAL_PAGE_SIZE)
+        if journal_page is None:
+            return None
+        cache.put(user_id, {**pages, page: journal_page}, generation)
+    return journal_page
+
+
+# --- invalidation from the ORM session --------------------------------------
+
+def _collect_changes(session, pending):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Chat) and obj.message_type == 'log':
+            pending.add(obj.user_id)
+
+
+def _apply_changes(pending):
+    for user_id in pending:
+        cache.invalidate(user_id)
+
+
+on_commit('journal_cache', _collect_changes, _apply_changes)
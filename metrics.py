@@ -0,0 +1,262 @@
+"""
+Process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are kept in memory and rendered by the
+/metrics endpoint. They cover:
+
+    http_*        requests, latency and in-flight requests per URL rule,
+                  against the worker threads of the running server
+    db_*          time spent in SQL statements
+    upstream_*    OpenAI call latency, errors and token usage per operation
+                  (chat, journal, tts, stt)
+    chat_turn_*   queue wait and duration of chat turns
+    chats_*       messages moved to the archive
+    tts_*, stt_*  speech payload sizes and TTS cache hits
+    *_cache_*     size, hits and misses of the in-process caches
+
+Values are per process; with several server processes each one must be
+scraped.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metric:
+    """Base for a named metric with a fixed set of label names"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f'{self.name}{_label_text(self.labelnames, key)} {value}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class CallbackGauge(Metric):
+    """Gauge whose value is read from fn() at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, fn):
+        super().__init__(name, documentation)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}', f'{self.name} {value}']
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter whose value is read from fn() at scrape time"""
+
+    kind = 'counter'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, then the sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def _samples(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), state[:-1]):
+            cumulative += count
+            labels = _label_text(self.labelnames, key, [('le', bound)])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _label_text(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {state[-1]}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+def register_cache(name, cache):
+    """Export the stats() of a TTLCache as <name>_cache_* metrics"""
+    CallbackGauge(f'{name}_cache_entries', f'Entries in the {name} cache', lambda: cache.stats()['entries'])
+    if cache.max_bytes is not None:
+        CallbackGauge(f'{name}_cache_bytes', f'Estimated size of the {name} cache', lambda: cache.stats()['bytes'])
+    CallbackCounter(f'{name}_cache_hits_total', f'Lookups answered by the {name} cache', lambda: cache.stats()['hits'])
+    CallbackCounter(f'{name}_cache_misses_total', f'Lookups missed by the {name} cache', lambda: cache.stats()['misses'])
+
+
+def render():
+    """All metrics in the text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by URL rule and status', ('method', 'route', 'status'))
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request time until the response is closed', ('route',))
+HTTP_EXCEPTIONS = Counter('http_exceptions_total', 'Unhandled exceptions while serving requests', ('route', 'exception'))
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests holding a server thread, including streams')
+# Set by whichever server starts the app: server.py for waitress,
+# gunicorn.conf.py for gunicorn
+SERVER_THREADS = Gauge('http_server_threads', 'Worker threads of the HTTP server running this process', ('server',))
+
+DB_LATENCY = Histogram('db_query_duration_seconds', 'SQL statement execution time', ('statement',), buckets=DB_BUCKETS)
+
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds',
+    'OpenAI call time including retries; streams until the first response',
+    ('operation', 'outcome')
+)
+UPSTREAM_ERRORS = Counter('upstream_errors_total', 'Failed OpenAI calls', ('operation', 'error'))
+UPSTREAM_TOKENS = Counter('upstream_tokens_total', 'OpenAI token usage', ('operation', 'kind'))
+
+CHATS_ARCHIVED = Counter('chats_archived_total', 'Chat messages moved to the archive table')
+CHAT_TURN_WAIT = Histogram('chat_turn_queue_seconds', 'Time chat turns wait for an executor worker')
+CHAT_TURN_DURATION = Histogram('chat_turn_duration_seconds', 'Time to generate and store a chat reply', ('status',))
+
+TTS_AUDIO_BYTES = Histogram('tts_audio_bytes', 'Size of synthesized speech', buckets=SIZE_BUCKETS)
+TTS_CACHE_LOOKUPS = Counter('tts_cache_lookups_total', 'TTS disk cache lookups', ('result',))
+STT_UPLOAD_BYTES = Histogram('stt_upload_bytes', 'Size of uploaded recordings', buckets=SIZE_BUCKETS)
+
+
+# --- HTTP requests -------------------------------------------------------------
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_metrics(app):
+    """Record latency, status and concurrency for every request"""
+
+    @app.before_request
+    def start_metrics_timer():
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_started' not in g:
+            return response
+        started = g.pop('metrics_started')
+        route = _route()
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+
+        def finished():
+            # Streams keep their thread until the body is sent
+            HTTP_IN_FLIGHT.dec()
+            HTTP_LATENCY.observe(time.perf_counter() - started, route=route)
+
+        if response.direct_passthrough:
+            # Files go straight to the server's file wrapper, which never
+            # closes the response
+            finished()
+        else:
+            response.call_on_close(finished)
+        return response
+
+    @app.teardown_request
+    def release_unfinished_request(exc=None):
+        if exc is not None:
+            HTTP_EXCEPTIONS.inc(route=_route(), exception=type(exc).__name__)
+        # after_request did not run, so nothing will close the response
+        if g.pop('metrics_started', None) is not None:
+            HTTP_IN_FLIGHT.dec()
+
+
+# --- database ----------------------------------------------------------------
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if starts:
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        DB_LATENCY.observe(time.perf_counter() - starts.pop(), statement=verb)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    starts = context.connection.info.get('metrics_query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
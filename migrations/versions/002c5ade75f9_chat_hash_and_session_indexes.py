@@ -0,0 +1,46 @@
+"""chat message hash and session indexes
+
+Adds chats.message_hash for duplicate detection, and the indexes behind the
+duplicate check, per-request session validation and the session sweeper.
+Older startups added some of these already, so every step is skipped when
+its column or index exists.
+
+Revision ID: 002c5ade75f9
+Revises: ac3c6d7577a8
+Create Date: 2026-10-17 23:41:02.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002c5ade75f9'
+down_revision = 'ac3c6d7577a8'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_chats_user_message_hash', 'chats', ['user_id', 'message_hash']),
+    ('ix_user_sessions_user_active_expires', 'user_sessions', ['user_id', 'is_active', 'expires_at']),
+    ('ix_user_sessions_expires_at', 'user_sessions', ['expires_at']),
+]
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('chats')}
+    if 'message_hash' not in columns:
+        op.add_column('chats', sa.Column('message_hash', sa.String(length=64), nullable=True))
+    # CONCURRENTLY keeps the tables writable during the build on PostgreSQL,
+    # where it cannot run inside a transaction; SQLite ignores it
+    with op.get_context().autocommit_block():
+        for name, table, index_columns in INDEXES:
+            op.create_index(name, table, index_columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_column('message_hash')
@@ -0,0 +1,104 @@
+"""chat search index
+
+Full-text index over chats and chats_archive messages for /search (see
+search.py).
+
+SQLite: an FTS5 table, chats_fts, keyed by the chat id and kept up to date by
+triggers on both tables. Archiving a message copies it to chats_archive
+before deleting it from chats, so the delete trigger keeps index rows whose
+message is in the archive.
+
+PostgreSQL: GIN indexes on to_tsvector('simple', message), built
+CONCURRENTLY like the other indexes. The expression must match
+search.TS_CONFIG for the planner to use them.
+
+Revision ID: 5b7e1d0c93a4
+Revises: f8e2cdf9ddef
+Create Date: 2026-10-18 00:21:47.093316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e1d0c93a4'
+down_revision = 'f8e2cdf9ddef'
+branch_labels = None
+depends_on = None
+
+GIN_INDEXES = [
+    ('ix_chats_message_tsv', 'chats'),
+    ('ix_chats_archive_message_tsv', 'chats_archive'),
+]
+
+# owner is 'u<user_id>' so the user filter is an index lookup, not a scan of
+# every user's matches
+SQLITE_FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5(
+    message, owner, message_type, timestamp UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+SQLITE_TRIGGERS = {
+    'chats_fts_insert': """
+        CREATE TRIGGER IF NOT EXISTS chats_fts_insert AFTER INSERT ON chats BEGIN
+            INSERT INTO chats_fts (rowid, message, owner, message_type, timestamp)
+            VALUES (new.id, new.message, 'u' || new.user_id, new.message_type, new.timestamp);
+        END
+    """,
+    'chats_fts_update': """
+        CREATE TRIGGER IF NOT EXISTS chats_fts_update AFTER UPDATE OF message, message_type ON chats BEGIN
+            UPDATE chats_fts SET message = new.message, message_type = new.message_type
+            WHERE rowid = new.id;
+        END
+    """,
+    'chats_fts_delete': """
+        CREATE TRIGGER IF NOT EXISTS chats_fts_delete AFTER DELETE ON chats BEGIN
+            DELETE FROM chats_fts
+            WHERE rowid = old.id AND NOT EXISTS (SELECT 1 FROM chats_archive WHERE id = old.id);
+        END
+    """,
+    'chats_archive_fts_delete': """
+        CREATE TRIGGER IF NOT EXISTS chats_archive_fts_delete AFTER DELETE ON chats_archive BEGIN
+            DELETE FROM chats_fts
+            WHERE rowid = old.id AND NOT EXISTS (SELECT 1 FROM chats WHERE id = old.id);
+        END
+    """,
+}
+
+SQLITE_BACKFILL = """
+INSERT INTO chats_fts (rowid, message, owner, message_type, timestamp)
+SELECT id, message, 'u' || user_id, message_type, timestamp FROM {table}
+WHERE id NOT IN (SELECT rowid FROM chats_fts)
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, table in GIN_INDEXES:
+            with op.get_context().autocommit_block():
+                op.execute('SET statement_timeout = 0')
+                op.create_index(
+                    name, table, [sa.text("to_tsvector('simple', message)")],
+                    postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True
+                )
+                op.execute('RESET statement_timeout')
+    else:
+        op.execute(SQLITE_FTS_TABLE)
+        for ddl in SQLITE_TRIGGERS.values():
+            op.execute(ddl)
+        for table in ('chats', 'chats_archive'):
+            op.execute(SQLITE_BACKFILL.format(table=table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, table in reversed(GIN_INDEXES):
+            with op.get_context().autocommit_block():
+                op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        for name in SQLITE_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {name}')
+        op.execute('DROP TABLE IF EXISTS chats_fts')
@@ -0,0 +1,46 @@
+"""chat history indexes
+
+Per-user indexes for the chat reads on every page load:
+
+    ix_chats_user_id_id           history pages, model context and journal
+                                  refresh: one user's messages ordered by id
+    ix_chats_user_type_timestamp  /journal: one user's log entries, newest
+                                  first
+
+Built with CREATE INDEX CONCURRENTLY on PostgreSQL. If a concurrent build
+fails it leaves an INVALID index behind; drop it before running again.
+check_query_plans.py verifies that the hot queries use these indexes.
+
+Revision ID: ec573cb62ed8
+Revises: 002c5ade75f9
+Create Date: 2026-10-17 23:44:37.530871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ec573cb62ed8'
+down_revision = '002c5ade75f9'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_chats_user_id_id', 'chats', ['user_id', 'id']),
+    ('ix_chats_user_type_timestamp', 'chats', ['user_id', 'message_type', 'timestamp']),
+]
+
+
+def upgrade():
+    # CONCURRENTLY keeps chats writable during the build on PostgreSQL, where
+    # it cannot run inside a transaction; SQLite ignores it
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
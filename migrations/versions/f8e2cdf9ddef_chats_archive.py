@@ -0,0 +1,40 @@
+"""chats archive table
+
+Cold storage for old, summarized user and assistant messages (see
+archive.py). Rows keep their original chats.id.
+
+Revision ID: f8e2cdf9ddef
+Revises: ec573cb62ed8
+Create Date: 2026-10-18 00:02:11.604913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8e2cdf9ddef'
+down_revision = 'ec573cb62ed8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chats_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('message_type', sa.String(length=20), nullable=True),
+    sa.Column('message_hash', sa.String(length=64), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+    op.create_index('ix_chats_archive_user_id_id', 'chats_archive', ['user_id', 'id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_chats_archive_user_id_id', table_name='chats_archive')
+    op.drop_table('chats_archive')
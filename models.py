@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from hashing import hash_password, verify_password
 from datetime import datetime
+import hashlib
 import uuid
 
 db = SQLAlchemy()
@@ -21,10 +22,21 @@ class User(UserMixin, db.Model):
     sessions = db.relationship('UserSession', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)[0]
+    
+    def check_password_for_login(self, password):
+        """
+        Check password and upgrade a hash made with outdated parameters.
+
+        Returns whether the password is valid; the caller commits.
+        """
+        valid, needs_rehash = verify_password(self.password_hash, password)
+        if needs_rehash:
+            self.set_password(password)
+        return valid
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -40,6 +52,11 @@ class UserSession(db.Model):
     user_agent = db.Column(db.Text)
     is_active = db.Column(db.Boolean, default=True)
     
+    __table_args__ = (
+        db.Index('ix_user_sessions_user_active_expires', 'user_id', 'is_active', 'expires_at'),
+        db.Index('ix_user_sessions_expires_at', 'expires_at'),  # expiry sweeper
+    )
+    
     def is_expired(self):
         return datetime.utcnow() > self.expires_at
     
@@ -54,11 +71,84 @@ class Chat(db.Model):
     message = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     message_type = db.Column(db.String(20), default='user')  # 'user' or 'assistant'
+    message_hash = db.Column(db.String(64))  # sha256 of user messages, for duplicate detection
     
     # Relationship
     user = db.relationship('User', backref='chats', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_chats_user_message_hash', 'user_id', 'message_hash'),
+        db.Index('ix_chats_user_id_id', 'user_id', 'id'),  # history pages, context and journal refresh, by id
+        db.Index('ix_chats_user_type_timestamp', 'user_id', 'message_type', 'timestamp'),  # journal entries, newest first
+    )
+    
+    @staticmethod
+    def hash_message(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
     def __repr__(self):
         return f'<Chat {self.id}>'
 
+class ChatArchive(db.Model):
+    """User and assistant messages moved out of chats once old and summarized (see archive.py)"""
+    __tablename__ = 'chats_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # the original Chat.id
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime)
+    message_type = db.Column(db.String(20))
+    message_hash = db.Column(db.String(64))
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_chats_archive_user_id_id', 'user_id', 'id'),  # history pages past the hot table
+    )
+    
+    def __repr__(self):
+        return f'<ChatArchive {self.id}>'
+
+class ConversationSummary(db.Model):
+    """Rolling summary of the turns that no longer fit in the context window"""
+    __tablename__ = 'conversation_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False)
+    covered_until_id = db.Column(db.Integer, nullable=False)  # last Chat.id folded into the summary
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ConversationSummary user={self.user_id} until={self.covered_until_id}>'
+
+class JournalRun(db.Model):
+    """Progress of one nightly journal run, used to resume after a crash"""
+    __tablename__ = 'journal_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    run_date = db.Column(db.Date, unique=True, nullable=False)  # the day being summarized (UTC)
+    status = db.Column(db.String(20), default='running')  # 'running', 'incomplete' (some users failed) or 'completed'
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    duration_seconds = db.Column(db.Float)
+    users_total = db.Column(db.Integer, default=0)
+    users_done = db.Column(db.Integer, default=0)
+    users_failed = db.Column(db.Integer, default=0)
+    failures = db.Column(db.Text)  # JSON object: user_id -> error
+    
+    def __repr__(self):
+        return f'<JournalRun {self.run_date} {self.status}>'
+
+class JournalWatermark(db.Model):
+    """How far a user's journal has summarized their chats"""
+    __tablename__ = 'journal_watermarks'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    last_chat_id = db.Column(db.Integer, nullable=False, default=0)  # last Chat.id included in a log
+    log_chat_id = db.Column(db.Integer)  # the log entry for log_date, replaced when it is refreshed
+    log_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<JournalWatermark user={self.user_id} until={self.last_chat_id}>'
+
 # ResponseSession model removed - no longer using response IDs 
\ No newline at end of file
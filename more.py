@@ -1,39 +1,41 @@
-from openai import OpenAI
 from dotenv import load_dotenv
-from datetime import datetime
-import os
+import logging
 load_dotenv()
 
+import gateway
 
-def getresponse(inputtext, user_id=None, conversation_history=None, db_session=None):
-    """
-    Get AI response with conversation context using database-driven approach.
-    
-    Args:
-        inputtext: User's message
-        user_id: User ID for context (optional)
-        conversation_history: List of previous messages (optional)
-        db_session: Database session (optional)
-    """
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
-    # Always use chat completion with conversation history
-    return getresponse_with_history(inputtext, conversation_history)
+logger = logging.getLogger(__name__)
 
-def getresponse_with_history(inputtext, conversation_history=None):
-    """
-    Get AI response using chat completion with conversation history.
+SYSTEM_PROMPT = "You are an emotionally supportive AI psychologist. Provide compassionate, understanding responses that help users process their feelings and find clarity. CRITICAL: You must respond in exactly the same language that the user wrote their message in. If they write in English, respond in English. If they write in Spanish, respond in Spanish. If they write in Russian, respond in Russian. Never switch languages unless the user explicitly asks you to."
+
+FALLBACK_RESPONSE = "I'm sorry, I'm having trouble responding right now. Please try again."
+
+LOG_PROMPT = "Ты — эмоционально поддерживающий ИИ, который ведёт краткий лог взаимодействия с пользователем. Ты должен составить краткий, но информативный лог, отражающий следующее:\n\n1. Основные трудности или переживания, с которыми обратился пользователь (например, тревога, одиночество, выгорание, утрата, неуверенность и т.д.).\n\n2. Какие шаги ты предпринял для оказания эмоциональной поддержки (например, выслушал, дал возможность выразить чувства, помог переосмыслить ситуацию, напомнил о ресурсе, порекомендовал обратиться к специалисту и т.д.).\n\n3. Возможный эффект взаимодействия на пользователя, если он был выражен или замечен (например, \"пользователь стал спокойнее\", \"выразил благодарность\", \"сказал, что почувствовал облегчение\" и т.д.).\n\nНе выдумывай информацию — лог должен быть основан только на реальном содержании диалога. Стиль лога — нейтрально-доброжелательный, без оценок, коротко и по делу. Не используй конкретные имена, просто 'пользователь'."
+
+SUMMARY_PROMPT = "You maintain a running summary of a conversation between a user and an emotionally supportive AI psychologist. Merge the previous summary (if any) with the new turns into one concise summary that preserves the user's situation, feelings, important facts and any advice already given. Write the summary in the language the user uses. Do not invent anything."
+
+
+def build_chat_messages(inputtext, conversation_history=None, summary=None):
     """
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    Build the chat completion message list from conversation history.
     
-    # Build conversation messages
+    The system prompt and summary come first and older turns keep their
+    position, so consecutive calls share a prefix that upstream prompt
+    caching can reuse.
+    """
     messages = [
         {
             "role": "system",
-            "content": "You are an emotionally supportive AI psychologist. Provide compassionate, understanding responses that help users process their feelings and find clarity. CRITICAL: You must respond in exactly the same language that the user wrote their message in. If they write in English, respond in English. If they write in Spanish, respond in Spanish. If they write in Russian, respond in Russian. Never switch languages unless the user explicitly asks you to."
+            "content": SYSTEM_PROMPT
         }
     ]
     
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{summary}"
+        })
+    
     # Add conversation history if provided
     if conversation_history:
         for msg in conversation_history:
@@ -48,39 +50,111 @@ def getresponse_with_history(inputtext, conversation_history=None):
         "role": "user",
         "content": inputtext
     })
+    return messages
+
+
+def stream_response_with_history(inputtext, conversation_history=None, summary=None):
+    """
+    Stream AI response token by token using chat completion with conversation history.
     
+    Yields text deltas as the model emits them. Closing the generator (e.g. when
+    the client disconnects) closes the upstream stream so no further tokens are
+    generated.
+    """
+    messages = build_chat_messages(inputtext, conversation_history, summary)
+    
+    emitted = False
     try:
-        response = client.chat.completions.create(
+        stream = gateway.stream_chat_completion(
             model="gpt-4o-mini",
             messages=messages,
             max_tokens=500,
             temperature=0.7
         )
-        
-        answer = response.choices[0].message.content
-        return answer
-        
     except Exception as e:
-        print(f"Error in chat completion: {e}")
-        return "I'm sorry, I'm having trouble responding right now. Please try again."
+        logger.error(f"Error in chat completion: {e}")
+        yield FALLBACK_RESPONSE
+        return
+    
+    try:
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                gateway.record_usage('chat', chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                emitted = True
+                yield delta
+    except Exception as e:
+        logger.error(f"Error in streaming chat completion: {e}")
+        if not emitted:
+            yield FALLBACK_RESPONSE
+    finally:
+        stream.close()
 
 
 
-def createlog(user_id=None, conversation_history=None):
+def summarize_history(previous_summary=None, conversation_history=None):
+    """
+    Fold conversation turns into the rolling summary.
+    
+    Returns the new summary, or None if the summary could not be generated.
     """
-    Create a log entry based on conversation history.
-    Now uses database instead of file-based approach.
+    transcript = []
+    for msg in conversation_history or []:
+        speaker = "User" if msg['type'] == 'user' else "Assistant"
+        transcript.append(f"{speaker}: {msg['message']}")
+    
+    messages = [
+        {
+            "role": "system",
+            "content": SUMMARY_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"Previous summary:\n{previous_summary or '(none)'}\n\nNew turns:\n" + "\n".join(transcript)
+        }
+    ]
+    
+    try:
+        response = gateway.chat_completion(
+            operation='summary',
+            model="gpt-4o-mini",
+            messages=messages,
+            max_tokens=400,
+            temperature=0.3
+        )
+        return response.choices[0].message.content
+    
+    except Exception as e:
+        logger.error(f"Error summarizing conversation: {e}")
+        return None
+
+
+
+def generate_log(conversation_history=None, previous_log=None):
     """
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    Generate a log entry text for a conversation.
     
+    With previous_log, only the new messages are passed and the model updates
+    the earlier log instead of summarizing everything again.
+    Raises on upstream errors so callers can tell failures apart from logs.
+    """
     # Build conversation context for log generation
     messages = [
         {
             "role": "system",
-            "content": "Ты — эмоционально поддерживающий ИИ, который ведёт краткий лог взаимодействия с пользователем. Ты должен составить краткий, но информативный лог, отражающий следующее:\n\n1. Основные трудности или переживания, с которыми обратился пользователь (например, тревога, одиночество, выгорание, утрата, неуверенность и т.д.).\n\n2. Какие шаги ты предпринял для оказания эмоциональной поддержки (например, выслушал, дал возможность выразить чувства, помог переосмыслить ситуацию, напомнил о ресурсе, порекомендовал обратиться к специалисту и т.д.).\n\n3. Возможный эффект взаимодействия на пользователя, если он был выражен или замечен (например, \"пользователь стал спокойнее\", \"выразил благодарность\", \"сказал, что почувствовал облегчение\" и т.д.).\n\nНе выдумывай информацию — лог должен быть основан только на реальном содержании диалога. Стиль лога — нейтрально-доброжелательный, без оценок, коротко и по делу. Не используй конкретные имена, просто 'пользователь'."
+            "content": LOG_PROMPT
         }
     ]
     
+    if previous_log:
+        messages.append({
+            "role": "system",
+            "content": f"Предыдущий лог (диалог ниже — только новые сообщения после него):\n{previous_log}"
+        })
+    
     # Add conversation history if provided
     if conversation_history:
         for msg in conversation_history:
@@ -91,41 +165,28 @@ def createlog(user_id=None, conversation_history=None):
             })
     
     # Add log generation request
+    if previous_log:
+        request_text = "Обнови предыдущий лог с учётом новых сообщений выше. Верни один цельный краткий лог."
+    else:
+        request_text = "Составь краткий лог этого взаимодействия на основе диалога выше."
     messages.append({
         "role": "user",
-        "content": "Составь краткий лог этого взаимодействия на основе диалога выше."
+        "content": request_text
     })
     
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=300,
-            temperature=0.3
-        )
-        
-        log_entry = response.choices[0].message.content
-        
-        # Store log in database if user_id provided
-        if user_id:
-            from models import db, Chat
-            log_chat = Chat(
-                user_id=user_id,
-                message=log_entry,
-                message_type='log'
-            )
-            db.session.add(log_chat)
-            db.session.commit()
-        
-        return log_entry
-        
-    except Exception as e:
-        print(f"Error creating log: {e}")
-        return "Не удалось создать лог взаимодействия."
+    response = gateway.chat_completion(
+        operation='journal',
+        model="gpt-4o-mini",
+        messages=messages,
+        max_tokens=300,
+        temperature=0.3
+    )
+    return response.choices[0].message.content
 
 
 if __name__ == "__main__":
     print('more - first AI psychologist in Azerbaijan')
     text=input("Enter text...")
-    response=getresponse(inputtext=text)
-    print(response)
\ No newline at end of file
+    for delta in stream_response_with_history(inputtext=text):
+        print(delta, end='', flush=True)
+    print()
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""
+Real-time chat and voice channel over Socket.IO.
+
+Logged-in clients keep one connection to the /realtime namespace open
+instead of making HTTP requests for every message. Events:
+
+client -> server
+    chat_message   {usertext, idempotency_key} start a chat turn
+    voice_message  {audio, duration}           transcribe, reply and speak
+
+server -> client
+    status         {state, turn_id}            transcribing, thinking, speaking or idle
+    transcript     {turn_id, text}
+    token          {turn_id, text}             reply deltas as they are generated
+    reply          {turn_id, message, duplicate}
+    audio_chunk    {turn_id, seq, data}        mp3 bytes; the client acknowledges each one
+    audio_end      {turn_id, chunks}
+    turn_error     {turn_id, error}
+    busy           {error}                     the message was refused, try again later
+
+Turns run on the same chat executor as HTTP turns. Each connection has at
+most one turn in flight and a per-minute message allowance, audio is sent
+at most SOCKET_AUDIO_WINDOW unacknowledged chunks ahead of the client, and
+a user may hold SOCKET_MAX_CONNECTIONS_PER_USER connections at once.
+"""
+
+import io
+import logging
+import threading
+import time
+
+from flask import request, session
+from flask_login import current_user
+from flask_socketio import SocketIO, Namespace, ConnectionRefusedError, emit
+from werkzeug.datastructures import FileStorage
+
+from config import Config
+from turns import QueueFullError, IdempotencyKeyReusedError
+from user_sessions import is_session_valid
+from speech import transcribe_upload, synthesize_chunks, first_complete_sentence, prefetch_speech
+
+logger = logging.getLogger(__name__)
+
+socketio = SocketIO()
+
+
+class Connection:
+    """Limits and state of one socket connection"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.busy = False
+        self.connected = True
+        self.allowance = float(Config.SOCKET_MESSAGES_PER_MINUTE)
+        self.checked_at = time.monotonic()
+
+    def take_message(self):
+        """Token bucket refilled at SOCKET_MESSAGES_PER_MINUTE; False when empty"""
+        now = time.monotonic()
+        rate = Config.SOCKET_MESSAGES_PER_MINUTE
+        self.allowance = min(rate, self.allowance + (now - self.checked_at) * rate / 60)
+        self.checked_at = now
+        if self.allowance < 1:
+            return False
+        self.allowance -= 1
+        return True
+
+
+class RealtimeNamespace(Namespace):
+    """Socket.IO handlers for chat and voice turns"""
+
+    def __init__(self, namespace, chat_executor):
+        super().__init__(namespace)
+        self.chat_executor = chat_executor
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def on_connect(self, auth=None):
+        if not current_user.is_authenticated or not is_session_valid(session.get('session_id'), current_user.id):
+            raise ConnectionRefusedError('Authentication required')
+        with self._lock:
+            open_connections = sum(1 for c in self._connections.values() if c.user_id == current_user.id)
+            if open_connections >= Config.SOCKET_MAX_CONNECTIONS_PER_USER:
+                raise ConnectionRefusedError('Too many open connections')
+            self._connections[request.sid] = Connection(current_user.id)
+
+    def on_disconnect(self, reason=None):
+        with self._lock:
+            connection = self._connections.pop(request.sid, None)
+        if connection is not None:
+            # Running turns still finish and are stored; only the relay stops
+            connection.connected = False
+
+    def on_chat_message(self, data):
+        usertext = (data.get('usertext') or '').strip() if isinstance(data, dict) else ''
+        if not usertext:
+            emit('turn_error', {'turn_id': None, 'error': 'No message provided'})
+            return
+
+        connection = self._begin()
+        if connection is None:
+            return
+        key = (data.get('idempotency_key') or '').strip()[:128] or None
+        try:
+            self._relay_turn(connection, usertext, idempotency_key=key)
+        finally:
+            self._end(connection)
+
+    def on_voice_message(self, data):
+        audio = data.get('audio') if isinstance(data, dict) else None
+        if not isinstance(audio, bytes) or not audio:
+            emit('turn_error', {'turn_id': None, 'error': 'No audio provided'})
+            return
+        if len(audio) > Config.STT_MAX_BYTES:
+            emit('turn_error', {'turn_id': None, 'error': 'Recording is too large'})
+            return
+        duration = data.get('duration')
+        if isinstance(duration, (int, float)) and duration > Config.STT_MAX_DURATION:
+            emit('turn_error', {'turn_id': None, 'error': f"Recording is longer than {Config.STT_MAX_DURATION} seconds"})
+            return
+
+        connection = self._begin()
+        if connection is None:
+            return
+        try:
+            emit('status', {'state': 'transcribing', 'turn_id': None})
+            try:
+                upload = FileStorage(io.BytesIO(audio), filename='audio.webm', content_type='audio/webm')
+                transcript = transcribe_upload(upload).strip()
+            except Exception as e:
+                logger.error(f"Socket transcription failed for user {connection.user_id}: {e}")
+                emit('turn_error', {'turn_id': None, 'error': 'Speech recognition failed'})
+                return
+            emit('transcript', {'turn_id': None, 'text': transcript})
+            if not transcript:
+                return
+
+            turn = self._relay_turn(connection, transcript, speak=True)
+            if turn is not None and turn.message and connection.connected:
+                self._send_audio(connection, turn)
+        finally:
+            self._end(connection)
+
+    def _begin(self):
+        """Reserve the connection for a turn, or emit why it cannot start one"""
+        with self._lock:
+            connection = self._connections.get(request.sid)
+            if connection is None:
+                return None
+            if connection.busy:
+                error = 'A reply is already being generated'
+            elif not connection.take_message():
+                error = 'Too many messages, please slow down'
+            else:
+                connection.busy = True
+                return connection
+        emit('busy', {'error': error})
+        return None
+
+    def _end(self, connection):
+        connection.busy = False
+        if connection.connected:
+            emit('status', {'state': 'idle', 'turn_id': None})
+
+    def _relay_turn(self, connection, usertext, speak=False, idempotency_key=None):
+        """
+        Run usertext on the chat executor and relay the reply as it is
+        generated. Returns the finished turn, or None if it failed or the
+        client went away.
+        """
+        try:
+            turn = self.chat_executor.submit(connection.user_id, usertext, idempotency_key)
+        except QueueFullError:
+            emit('turn_error', {'turn_id': None, 'error': 'Server is busy, please try again shortly'})
+            return None
+        except IdempotencyKeyReusedError as e:
+            emit('turn_error', {'turn_id': None, 'error': str(e)})
+            return None
+        emit('status', {'state': 'thinking', 'turn_id': turn.id})
+
+        parts = []
+        offset = 0
+        prefetched = not speak
+        while connection.connected:
+            turn.wait(offset, timeout=15)
+            # Everything generated since the last emit goes out as one event,
+            # so a slow client gets fewer, larger token events
+            state = turn.snapshot(offset)
+            if state['text']:
+                offset = state['offset']
+                emit('token', {'turn_id': turn.id, 'text': state['text']})
+                if not prefetched:
+                    parts.append(state['text'])
+                    sentence = first_complete_sentence(''.join(parts))
+                    if sentence:
+                        prefetch_speech(sentence)
+                        prefetched = True
+            if turn.done:
+                break
+
+        if not connection.connected:
+            return None
+        if turn.status == 'failed':
+            emit('turn_error', {'turn_id': turn.id, 'error': turn.error})
+            return None
+        emit('reply', {'turn_id': turn.id, 'message': turn.message, 'duplicate': turn.duplicate})
+        return turn
+
+    def _send_audio(self, connection, turn):
+        """Send the reply's speech, at most SOCKET_AUDIO_WINDOW chunks ahead of the client's acks"""
+        emit('status', {'state': 'speaking', 'turn_id': turn.id})
+        window = threading.Semaphore(Config.SOCKET_AUDIO_WINDOW)
+        chunks = synthesize_chunks(turn.message)
+        sent = 0
+        try:
+            for chunk in chunks:
+                if not window.acquire(timeout=Config.SOCKET_ACK_TIMEOUT) or not connection.connected:
+                    logger.info(f"Client stopped acknowledging audio for turn {turn.id}, dropping the rest")
+                    return
+                emit(
+                    'audio_chunk',
+                    {'turn_id': turn.id, 'seq': sent, 'data': chunk},
+                    callback=lambda *args: window.release()
+                )
+                sent += 1
+        except Exception as e:
+            logger.error(f"Socket speech synthesis failed for turn {turn.id}: {e}")
+            emit('turn_error', {'turn_id': turn.id, 'error': 'Failed to synthesize speech'})
+            return
+        finally:
+            chunks.close()
+        emit('audio_end', {'turn_id': turn.id, 'chunks': sent})
+
+    def stats(self):
+        with self._lock:
+            return {
+                'connections': len(self._connections),
+                'busy': sum(1 for c in self._connections.values() if c.busy)
+            }
+
+
+def init_realtime(app, chat_executor):
+    """Attach the Socket.IO server to app and register the /realtime namespace"""
+    socketio.init_app(
+        app,
+        async_mode='threading',
+        # Room for a maximum-size recording plus the event framing
+        max_http_buffer_size=Config.STT_MAX_BYTES + 64 * 1024,
+        transports=Config.SOCKETIO_TRANSPORTS
+    )
+    namespace = RealtimeNamespace('/realtime', chat_executor)
+    socketio.on_namespace(namespace)
+    return namespace
@@ -0,0 +1,151 @@
+"""
+Full-text search over a user's chat messages and journal entries.
+
+Backed by the index the 5b7e1d0c93a4 migration creates: an FTS5 table
+(chats_fts) on SQLite, GIN expression indexes on PostgreSQL. Both cover chats
+and chats_archive and are maintained by the database on every write, so
+archived messages stay searchable. Results are ranked (bm25 / ts_rank),
+paginated by page number and come with an HTML snippet in which the matched
+terms are wrapped in <mark>.
+"""
+
+import html
+import re
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+
+from config import Config
+from models import db
+
+SEARCH_TYPES = ('user', 'assistant', 'log')
+
+# Text search configuration of the PostgreSQL indexes; queries must use the
+# same expression for the planner to pick them
+TS_CONFIG = 'simple'
+
+# Shorter last terms are matched whole: a one-letter prefix matches most
+# of the index
+PREFIX_MIN_LENGTH = 2
+
+# Highlight markers: control characters cannot collide with the escaped text
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+SQLITE_SEARCH = text("""
+    SELECT rowid AS id, message_type, timestamp,
+           snippet(chats_fts, 0, :mark_start, :mark_end, '…', :snippet_words) AS snippet,
+           -bm25(chats_fts, 1.0, 0.0, 0.0, 0.0) AS score
+    FROM chats_fts
+    WHERE chats_fts MATCH :match
+    ORDER BY bm25(chats_fts, 1.0, 0.0, 0.0, 0.0), rowid DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+# ts_headline re-parses each message, so it only runs on the page's rows
+POSTGRES_SEARCH = text(f"""
+    WITH q AS (SELECT to_tsquery('{TS_CONFIG}', :tsquery) AS query),
+    matches AS (
+        SELECT c.id, c.message, c.message_type, c.timestamp FROM chats c, q
+        WHERE c.user_id = :user_id AND c.message_type IN :types
+          AND to_tsvector('{TS_CONFIG}', c.message) @@ q.query
+        UNION ALL
+        SELECT a.id, a.message, a.message_type, a.timestamp FROM chats_archive a, q
+        WHERE a.user_id = :user_id AND a.message_type IN :types
+          AND to_tsvector('{TS_CONFIG}', a.message) @@ q.query
+    ),
+    page AS (
+        SELECT m.*, ts_rank(to_tsvector('{TS_CONFIG}', m.message), q.query) AS score
+        FROM matches m, q
+        ORDER BY score DESC, m.id DESC
+        LIMIT :limit OFFSET :offset
+    )
+    SELECT page.id, page.message_type, page.timestamp,
+           ts_headline('{TS_CONFIG}', page.message, q.query, :headline_options) AS snippet,
+           page.score
+    FROM page, q
+    ORDER BY page.score DESC, page.id DESC
+""").bindparams(bindparam('types', expanding=True))
+
+
+def search_terms(query):
+    """The words of a search query, at most SEARCH_MAX_TERMS of them"""
+    return re.findall(r'\w+', query or '')[:Config.SEARCH_MAX_TERMS]
+
+
+def fts5_match(user_id, terms, types):
+    """FTS5 MATCH expression for the user's messages of `types` containing every term"""
+    phrases = [f'"{term}"' for term in terms]
+    if len(terms[-1]) >= PREFIX_MIN_LENGTH:
+        phrases[-1] += '*'
+    return (
+        f"owner : u{int(user_id)} AND message_type : ({' OR '.join(types)}) "
+        f"AND message : ({' '.join(phrases)})"
+    )
+
+
+def tsquery(terms):
+    """to_tsquery expression containing every term; \\w+ terms need no escaping inside quotes"""
+    lexemes = [f"'{term}'" for term in terms]
+    if len(terms[-1]) >= PREFIX_MIN_LENGTH:
+        lexemes[-1] += ':*'
+    return ' & '.join(lexemes)
+
+
+def highlight(snippet):
+    """Escape a snippet for HTML and turn the match markers into <mark> tags"""
+    return html.escape(snippet or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def _timestamp(value):
+    # FTS5 keeps the timestamp as the text SQLite stored it
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat() if value else None
+
+
+def search_messages(user_id, query, types=SEARCH_TYPES, page=1, per_page=None):
+    """
+    One page of the user's messages matching every word of `query`, best
+    match first.
+
+    Returns (results, has_more); results are dicts with id, type, timestamp,
+    snippet (HTML) and score. Queries without words return no results.
+    """
+    per_page = per_page or Config.SEARCH_PAGE_SIZE
+    terms = search_terms(query)
+    types = [t for t in SEARCH_TYPES if t in types]
+    if not terms or not types:
+        return [], False
+
+    # Fetch one extra row to know whether another page exists
+    params = {'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(POSTGRES_SEARCH, dict(
+            params,
+            user_id=user_id,
+            types=types,
+            tsquery=tsquery(terms),
+            headline_options=(
+                f'StartSel={MARK_START}, StopSel={MARK_END}, '
+                f'MaxWords={Config.SEARCH_SNIPPET_WORDS}, MinWords={Config.SEARCH_SNIPPET_WORDS // 2}, '
+                'MaxFragments=2, FragmentDelimiter=" … "'
+            )
+        )).all()
+    else:
+        rows = db.session.execute(SQLITE_SEARCH, dict(
+            params,
+            match=fts5_match(user_id, terms, types),
+            mark_start=MARK_START,
+            mark_end=MARK_END,
+            snippet_words=Config.SEARCH_SNIPPET_WORDS
+        )).all()
+
+    results = [{
+        'id': row.id,
+        'type': row.message_type,
+        'timestamp': _timestamp(row.timestamp),
+        'snippet': highlight(row.snippet),
+        'score': round(float(row.score), 4)
+    } for row in rows[:per_page]]
+    return results, len(rows) > per_page
@@ -1,46 +1,60 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
-from flask_login import LoginManager, current_user, login_required
-from more import getresponse, createlog
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, Response, session
+from flask_login import LoginManager, current_user, login_required, logout_user, user_loaded_from_cookie
+from journal import run_daily_journals, refresh_journal
 from waitress import serve
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import threading
 import time
 import logging
-from openai import OpenAI
-from pathlib import Path
-from werkzeug.utils import secure_filename
+import json
+import base64
+from werkzeug.exceptions import RequestEntityTooLarge, NotFound
+from markupsafe import Markup
 
 
 # Import our authentication modules
 from config import Config
-from models import db, User, Chat
+from models import db, User
 from auth import auth
-
-UPLOAD_FOLDER = './uploads/'
+import history_cache
+import journal_cache
+import search
+import user_cache
+from user_cache import load_identity
+import user_sessions
+from user_sessions import is_session_valid, extend_session, resume_remembered_session, start_session_sweeper
+from archive import start_chat_archiver
+from turns import TurnExecutor, QueueFullError, IdempotencyKeyReusedError
+from realtime import init_realtime
+import gateway
+import hashing
+import database
+import health
+from access_log import configure_logging, init_access_log, dropped_records
+import metrics
+from speech import (
+    synthesize_cached, synthesize_chunks, first_complete_sentence, prefetch_speech,
+    SpooledUploadRequest, upload_size, transcribe_upload
+)
 
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
 app.config.from_object(Config)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# Fork the password hashing workers before any background thread starts
+hashing.start_pool()
 
-# Add request logging middleware
-@app.before_request
-def log_request_info():
-    logger.info(f'Request: {request.method} {request.url} - IP: {request.remote_addr} - User-Agent: {request.headers.get("User-Agent", "Unknown")}')
+# Configure logging: records are written by a background thread (see access_log.py)
+configure_logging()
+logger = logging.getLogger(__name__)
 
-@app.after_request
-def log_response_info(response):
-    logger.info(f'Response: {response.status_code} for {request.method} {request.url}')
-    return response
+# One structured access log line per request, and request metrics
+init_access_log(app)
+metrics.init_metrics(app)
 
-# Initialize database
-db.init_app(app)
+# Initialize database with the engine profile for DATABASE_URL
+database.init_app(app)
 
 # Create database tables if they don't exist
 def init_database_on_startup():
@@ -52,18 +66,18 @@ def init_database_on_startup():
             db_path = Path("moreai.db")
             
             if db_path.exists():
-                print("📁 Database file found, checking tables...")
+                logger.info("Database file found, checking tables")
                 try:
                     # Try to query the database to see if tables exist
                     User.query.first()
-                    print("✅ Database tables already exist and are working")
+                    logger.info("Database tables already exist and are working")
                     
                     # Check if admin user exists
                     admin_user = User.query.filter_by(username='admin').first()
                     if admin_user:
-                        print("✅ Admin user exists")
+                        logger.info("Admin user exists")
                     else:
-                        print("👤 Creating admin user...")
+                        logger.info("Creating admin user")
                         admin = User(
                             username='admin',
                             is_admin=True,
@@ -72,30 +86,30 @@ def init_database_on_startup():
                         admin.set_password('Admin123!')
                         db.session.add(admin)
                         db.session.commit()
-                        print("✅ Admin user created (username: admin, password: Admin123!)")
+                        logger.info("Admin user created (username: admin, password: Admin123!)")
                     
                 except Exception as e:
-                    print(f"⚠️  Database exists but tables may be corrupted: {e}")
-                    print("🔄 Recreating database tables...")
+                    logger.warning(f"Database exists but tables may be corrupted: {e}")
+                    logger.warning("Recreating database tables")
                     db.drop_all()
                     db.create_all()
                     create_admin_user()
                     
             else:
-                print("🔄 Database file not found, creating new database...")
+                logger.info("Database file not found, creating new database")
                 db.create_all()
                 create_admin_user()
                 
         except Exception as e:
-            print(f"❌ Database initialization failed: {e}")
-            print("🔄 Attempting to recreate database...")
+            logger.error(f"Database initialization failed: {e}")
+            logger.warning("Attempting to recreate database")
             try:
                 db.drop_all()
                 db.create_all()
                 create_admin_user()
-                print("✅ Database recreated successfully")
+                logger.info("Database recreated successfully")
             except Exception as e2:
-                print(f"❌ Failed to recreate database: {e2}")
+                logger.error(f"Failed to recreate database: {e2}")
                 raise e2
 
 def create_admin_user():
@@ -103,7 +117,7 @@ def create_admin_user():
     try:
         admin_user = User.query.filter_by(username='admin').first()
         if not admin_user:
-            print("👤 Creating admin user...")
+            logger.info("Creating admin user")
             admin = User(
                 username='admin',
                 is_admin=True,
@@ -112,19 +126,29 @@ def create_admin_user():
             admin.set_password('Admin123!')
             db.session.add(admin)
             db.session.commit()
-            print("✅ Admin user created (username: admin, password: Admin123!)")
+            logger.info("Admin user created (username: admin, password: Admin123!)")
         else:
-            print("✅ Admin user already exists")
+            logger.info("Admin user already exists")
     except Exception as e:
-        print(f"⚠️  Could not create admin user: {e}")
+        logger.warning(f"Could not create admin user: {e}")
 
 # Initialize database on startup
 try:
     init_database_on_startup()
 except Exception as e:
-    print(f"❌ Database initialization failed: {e}")
-    print("⚠️  The application will start but authentication may not work properly")
-    print("💡 Try running 'python init_db.py' manually to troubleshoot")
+    logger.error(f"Database initialization failed: {e}")
+    logger.warning("The application will start but authentication may not work properly")
+    logger.warning("Try running 'python init_db.py' manually to troubleshoot")
+
+# Kept out of the block above so a failed upgrade never recreates the
+# database. Serving on a half-migrated schema breaks most routes, so a
+# failed upgrade stops startup instead.
+with app.app_context():
+    try:
+        database.upgrade_schema()
+    except Exception:
+        logger.exception("Could not upgrade the database schema")
+        raise
 
 # Initialize Flask-Login
 login_manager = LoginManager()
@@ -134,73 +158,122 @@ login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    user = User.query.get(int(user_id))
-    if user:
-        print(f"👤 User loader: Loaded user {user.username} (ID: {user.id})")
-    else:
-        print(f"❌ User loader: No user found for ID {user_id}")
+    # A cached read-only snapshot; see user_cache.py
+    user = load_identity(int(user_id))
+    if user is None:
+        logger.warning(f"User loader: no user found for ID {user_id}")
     return user
 
+# A browser that kept only the remember cookie gets a new server-side session
+user_loaded_from_cookie.connect(resume_remembered_session, app)
+
 # Register authentication blueprint
 app.register_blueprint(auth, url_prefix='/auth')
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-speech_folder = Path(__file__).parent / "static" / "speech"
-speech_folder.mkdir(parents=True, exist_ok=True)
-uploads_folder = Path(__file__).parent / "uploads"
-uploads_folder.mkdir(parents=True, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+@app.before_request
+def check_user_session():
+    """Log the user out when their server-side session was revoked or has expired"""
+    if not current_user.is_authenticated:
+        return
+    session_id = session.get('session_id')
+    if is_session_valid(session_id, current_user.id):
+        extend_session(session_id)
+    else:
+        logout_user()
+        session.pop('session_id', None)
+        # @login_required on the route now rejects the request
+
+@app.errorhandler(gateway.CircuitOpenError)
+def handle_circuit_open(e):
+    """Fail fast while the OpenAI upstream is degraded"""
+    logger.warning(str(e))
+    return jsonify({"error": "Service temporarily unavailable, please try again shortly"}), 503
+
+class InvalidArgument(Exception):
+    """A query parameter has an invalid value; served as a 400"""
+
+@app.errorhandler(InvalidArgument)
+def handle_invalid_argument(e):
+    return jsonify({"error": str(e)}), 400
+
+def int_arg(name, default=None, minimum=1, maximum=None):
+    """
+    Integer query parameter, or `default` when it is absent. Paging input is
+    rejected rather than clamped: anything but an integer from minimum to
+    maximum raises InvalidArgument.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum or (maximum is not None and number > maximum):
+        allowed = f"from {minimum} to {maximum}" if maximum is not None else f"of at least {minimum}"
+        raise InvalidArgument(f"{name} must be a number {allowed}")
+    return number
+
+@app.errorhandler(hashing.HashingBusyError)
+def handle_hashing_busy(e):
+    """Shed login and registration load instead of queueing it on request threads"""
+    logger.warning(str(e))
+    return jsonify({"error": "Server is busy, please try again shortly"}), 503, {'Retry-After': '2'}
+
+chat_executor = TurnExecutor(
+    app,
+    max_workers=Config.CHAT_WORKERS,
+    max_pending=Config.CHAT_QUEUE_LIMIT,
+    result_ttl=Config.CHAT_TURN_RESULT_TTL
+)
+realtime_channel = init_realtime(app, chat_executor) if Config.REALTIME_ENABLED else None
+metrics.CallbackGauge('chat_turns_running', 'Chat turns being generated', lambda: chat_executor.stats()['running'])
+metrics.CallbackGauge('chat_turns_queued', 'Chat turns waiting for a worker', lambda: chat_executor.stats()['queued'])
+metrics.CallbackGauge('log_records_dropped', 'Log records dropped because the writer thread fell behind', dropped_records)
+metrics.register_cache('history', history_cache.cache)
+metrics.register_cache('user', user_cache.cache)
+metrics.register_cache('session', user_sessions.cache)
+metrics.register_cache('journal', journal_cache.cache)
+
+
+@app.context_processor
+def inject_realtime_settings():
+    """Socket.IO client options for the chat and voice pages"""
+    return {
+        'realtime_enabled': realtime_channel is not None,
+        'socketio_transports': Config.SOCKETIO_TRANSPORTS
+    }
 
 
 def midnight_checker():
-    """Create daily logs for all users at midnight"""
+    """Create daily logs for all users once the UTC day is over"""
     while True:
-        now = datetime.now()
-        if now.hour == 0 and now.minute == 0:
-            try:
-                # Get all users and create logs for their conversations
-                users = User.query.all()
-                for user in users:
-                    # Get user's conversations from today
-                    today_start = datetime(now.year, now.month, now.day)
-                    user_chats = Chat.query.filter(
-                        Chat.user_id == user.id,
-                        Chat.timestamp >= today_start,
-                        Chat.message_type.in_(['user', 'assistant'])
-                    ).order_by(Chat.timestamp).all()
-                    
-                    if user_chats:
-                        # Convert to conversation history format
-                        conversation_history = []
-                        for chat in user_chats:
-                            conversation_history.append({
-                                'message': chat.message,
-                                'type': chat.message_type
-                            })
-                        
-                        # Create log entry
-                        createlog(user_id=user.id, conversation_history=conversation_history)
-                
-                print("✅ Daily logs created for all users")
-            except Exception as e:
-                print(f"❌ Error creating daily logs: {e}")
+        try:
+            with app.app_context():
+                # Completed runs return immediately; an interrupted or missed
+                # run for yesterday is picked up on the next tick.
+                yesterday = datetime.utcnow().date() - timedelta(days=1)
+                run_daily_journals(yesterday)
+        except Exception as e:
+            logger.error(f"Error creating daily logs: {e}")
         
         time.sleep(60)
 
 midnight_thread = threading.Thread(target=midnight_checker, daemon=True)
 midnight_thread.start()
 
+session_sweeper_thread = start_session_sweeper(app)
+health_stats_thread = health.start_stats_refresher(app)
+chat_archiver_thread = start_chat_archiver(app) if Config.CHAT_ARCHIVE_AFTER_DAYS > 0 else None
+
 
 @app.route('/')
 @app.route('/index')
 def index():
-    logger.info(f"Root route accessed - User authenticated: {current_user.is_authenticated}")
     # If user is logged in, redirect to chat to show their history
     if current_user.is_authenticated:
-        logger.info(f"Redirecting authenticated user {current_user.username} to chat")
         return redirect(url_for('getresp'))
     
-    logger.info("Serving index.html to unauthenticated user")
     return render_template('index.html')
 
 @app.route('/login')
@@ -211,30 +284,101 @@ def login_page():
 def register_page():
     return render_template('register.html')
 
+@app.route('/health/live')
+def health_live():
+    """
+    Liveness probe: the process is up and serving requests. A broken
+    password hashing pool is only fixed by a restart (see hashing.py), so it
+    fails this probe to get the process replaced.
+    """
+    if hashing.is_broken():
+        return jsonify({'status': 'broken', 'password_hashing': 'unavailable'}), 503
+    return jsonify({'status': 'alive'}), 200
+
+
+@app.route('/health/ready')
+def health_ready():
+    """
+    Readiness probe: the database answers and password hashing works; the
+    OpenAI gateway state is reported
+    """
+    db_error = health.check_database()
+    upstream = gateway.status()
+    hashing_broken = hashing.is_broken()
+    if db_error or hashing_broken:
+        status, code = 'unavailable', 503
+    elif upstream['state'] != 'closed':
+        # Without the upstream, history and the journal are still served
+        status, code = 'degraded', 200
+    else:
+        status, code = 'ready', 200
+    body = {
+        'status': status,
+        'database': 'error' if db_error else 'connected',
+        'upstream': upstream,
+        'password_hashing': 'unavailable' if hashing_broken else 'ok',
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    if db_error:
+        body['error'] = db_error
+    return jsonify(body), code
+
+
 @app.route('/health')
 def health_check():
-    """Health check endpoint to verify database connectivity"""
-    try:
-        # Test database connection
-        user_count = User.query.count()
-        chat_count = Chat.query.count()
-        session_count = UserSession.query.count()
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'user_count': user_count,
-            'chat_count': chat_count,
-            'session_count': session_count,
-            'timestamp': datetime.utcnow().isoformat()
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'database': 'error',
-            'error': str(e),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 500
+    """Readiness plus table row counts from the in-memory statistics (see health.py)"""
+    db_error = health.check_database()
+    table_stats = health.stats.snapshot()
+    body = {
+        'status': 'unhealthy' if db_error else 'healthy',
+        'database': 'error' if db_error else 'connected',
+        **(table_stats['counts'] or {}),
+        'counted_at': table_stats['counted_at'],
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    if db_error:
+        body['error'] = db_error
+    return jsonify(body), 500 if db_error else 200
+
+
+@app.route('/health/queue')
+def queue_health():
+    """Chat executor load (running turns, queue depth) and open socket connections"""
+    stats = chat_executor.stats()
+    if realtime_channel is not None:
+        stats['realtime'] = realtime_channel.stats()
+    return jsonify(stats), 200
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint; needs METRICS_TOKEN as a bearer token when it is set"""
+    if Config.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {Config.METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def load_history_page(user_id, before=None, limit=50):
+    """
+    Load up to `limit` chat messages older than Chat.id `before` (newest page
+    when `before` is None).
+
+    Returns the page in chronological order and the cursor for the next older
+    page, or None when there is nothing older.
+    """
+    if before is None:
+        cached_page = history_cache.get_state(user_id).newest_page(limit)
+        if cached_page is not None:
+            history, has_more = cached_page
+            return history, (history[0]['id'] if has_more else None)
+    
+    # Fetch one extra row to know whether an older page exists; pages past
+    # the hot table are read from the archive
+    messages = history_cache.load_older(user_id, before or None, limit + 1)
+    has_more = len(messages) > limit
+    history = list(reversed(messages[:limit]))
+    next_before = history[0]['id'] if has_more else None
+    return history, next_before
 
 
 @app.route('/chat')
@@ -243,98 +387,216 @@ def getresp():
     usertext = request.args.get('usertext')
     
     if usertext:
-        # Check if this exact message was just sent (prevent duplicates)
-        recent_message = Chat.query.filter_by(
-            user_id=current_user.id,
-            message=usertext,
-            message_type='user'
-        ).order_by(Chat.timestamp.desc()).first()
-        
-        # If the same message was sent within the last 30 seconds, don't process it
-        if recent_message and (datetime.utcnow() - recent_message.timestamp).seconds < 30:
-            print(f"Duplicate message detected, skipping: {usertext}")
-        else:
-            # Get user's previous conversation history (excluding the current message)
-            previous_chats = Chat.query.filter_by(user_id=current_user.id).order_by(Chat.timestamp).all()
-            conversation_history = []
-            for chat in previous_chats:
-                conversation_history.append({
-                    'message': chat.message,
-                    'type': chat.message_type
-                })
-            
-            # Store user message
-            print(f"💾 Storing user message for: {current_user.username} (ID: {current_user.id})")
-            user_chat = Chat(
-                user_id=current_user.id,
-                message=usertext,
-                message_type='user'
-            )
-            db.session.add(user_chat)
-            db.session.flush()  # Get the ID without committing
-            
-            # Get AI response with conversation history (excluding the current message)
-            ai_response = getresponse(usertext, user_id=current_user.id, conversation_history=conversation_history, db_session=db.session)
-            if ai_response:
-                print(f"🤖 Storing AI response for: {current_user.username} (ID: {current_user.id})")
-                ai_chat = Chat(
-                    user_id=current_user.id,
-                    message=ai_response,
-                    message_type='assistant'
-                )
-                db.session.add(ai_chat)
-            
-            db.session.commit()
-            print(f"✅ Messages committed to database for user: {current_user.username}")
+        # Run the turn on the chat executor and wait for it, so this legacy
+        # path is subject to the same concurrency limit as /chat/turns
+        try:
+            turn = chat_executor.submit(current_user.id, usertext)
+        except QueueFullError as e:
+            logger.warning(str(e))
+            return jsonify({"error": "Server is busy, please try again shortly"}), 503
+        turn.wait_done(timeout=Config.CHAT_TURN_WAIT_TIMEOUT)
         
         # Redirect to clear URL parameters and prevent resubmission on refresh
         from flask import redirect, url_for
         return redirect(url_for('getresp'))
 
-    # Get user's chat history from database
-    print(f"🔍 Loading chat history for user: {current_user.username} (ID: {current_user.id})")
-    user_chats = Chat.query.filter_by(user_id=current_user.id).order_by(Chat.timestamp).all()
-    print(f"📊 Found {len(user_chats)} chat messages for user {current_user.username}")
-    
-    # Format chat history for display
-    history = []
-    for chat in user_chats:
-        history.append({
-            'message': chat.message,
-            'type': chat.message_type,
-            'timestamp': chat.timestamp.isoformat()
-        })
+    # Get one page of the user's chat history (newest first, keyset by Chat.id)
+    before = int_arg('before')
+    limit = int_arg('limit', Config.CHAT_PAGE_SIZE, maximum=Config.CHAT_PAGE_SIZE_MAX)
+    history, next_before = load_history_page(current_user.id, before=before, limit=limit)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify(history=history)
+        return jsonify(history=history, next_before=next_before)
+
+    return render_template("chat.html", history=history, next_before=next_before)
+
+
+def sse_event(event, data, event_id=None):
+    """Format a Server-Sent Events message"""
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def idempotency_key(data=None):
+    """Client-supplied idempotency key from the Idempotency-Key header or the request data"""
+    key = (request.headers.get('Idempotency-Key') or (data or {}).get('idempotency_key') or '').strip()
+    return key[:128] or None
 
-    return render_template("chat.html", history=history)
+
+def ndjson_event(data):
+    """Format one line of a newline-delimited JSON stream"""
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+@app.route('/chat/turns', methods=['POST'])
+@login_required
+def submit_chat_turn():
+    """Accept a chat message and generate the reply in the background"""
+    data = request.get_json(silent=True) or request.form
+    usertext = (data.get('usertext') or '').strip()
+    if not usertext:
+        return jsonify({"error": "No message provided"}), 400
+    
+    try:
+        turn = chat_executor.submit(current_user.id, usertext, idempotency_key(data))
+    except QueueFullError as e:
+        logger.warning(str(e))
+        return jsonify({"error": "Server is busy, please try again shortly"}), 503
+    except IdempotencyKeyReusedError as e:
+        return jsonify({"error": str(e)}), 422
+    
+    stats = chat_executor.stats()
+    return jsonify({
+        'turn_id': turn.id,
+        'status': turn.status,
+        'queue_depth': stats['queued'],
+        'poll_url': url_for('get_chat_turn', turn_id=turn.id),
+        'stream_url': url_for('stream_chat_turn', turn_id=turn.id)
+    }), 202
+
+
+@app.route('/chat/turns/<turn_id>')
+@login_required
+def get_chat_turn(turn_id):
+    """Poll a chat turn; ?offset=N returns only text generated after N characters"""
+    turn = chat_executor.get(turn_id, current_user.id)
+    if turn is None:
+        return jsonify({"error": "Turn not found"}), 404
+    return jsonify(turn.snapshot(offset=request.args.get('offset', 0, type=int)))
+
+
+@app.route('/chat/turns/<turn_id>/stream')
+@login_required
+def stream_chat_turn(turn_id):
+    """
+    Stream a chat turn token by token as Server-Sent Events.
+
+    Each delta carries the offset it ends at as its event id, so a
+    reconnecting EventSource resumes after the last text it received
+    (Last-Event-ID); ?offset=N does the same for other clients.
+    """
+    turn = chat_executor.get(turn_id, current_user.id)
+    if turn is None:
+        return jsonify({"error": "Turn not found"}), 404
+    offset = request.headers.get('Last-Event-ID', type=int)
+    if offset is None:
+        offset = request.args.get('offset', 0, type=int)
+    
+    def generate(offset):
+        # The turn runs on the chat executor, so a client disconnect only stops
+        # this relay; the reply is still generated and stored in full.
+        while True:
+            turn.wait(offset, timeout=15)
+            state = turn.snapshot(offset)
+            if state['text']:
+                offset = state['offset']
+                yield sse_event('delta', {'text': state['text']}, event_id=offset)
+            elif not turn.done:
+                yield ": keep-alive\n\n"
+            if turn.done:
+                break
+        
+        if turn.status == 'failed':
+            yield sse_event('failed', {'error': turn.error})
+        yield sse_event('done', {
+            'message': turn.message,
+            'duplicate': turn.duplicate,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    
+    return Response(
+        generate(offset),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 
 @app.route('/journal')
 @login_required
 def journal():
-    # Get user's log entries from database
-    user_logs = Chat.query.filter_by(
-        user_id=current_user.id,
-        message_type='log'
-    ).order_by(Chat.timestamp.desc()).all()
+    """
+    One page of the user's journal, newest first. The entries are rendered
+    from journal_cache, and a browser that already has this version of the
+    page gets a 304 without the page being rendered.
+    """
+    page = int_arg('page', 1)
+    journal_page = journal_cache.load_page(current_user.id, page)
+    if journal_page is None:
+        raise NotFound()
     
-    # Format logs for display
-    journal_entries = []
-    for log in user_logs:
-        journal_entries.append({
-            'content': log.message,
-            'timestamp': log.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
+    response = Response(mimetype='text/html')
+    response.set_etag(journal_page.etag, weak=True)
+    response.last_modified = journal_page.last_modified
+    # Private to the user, and revalidated on every visit so a new entry shows up
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+    
+    response.set_data(render_template('journal.html', journal_html=Markup(journal_page.html)))
+    return response
+
+
+@app.route('/journal/refresh', methods=['POST'])
+@login_required
+def refresh_journal_entry():
+    """Update today's journal entry with messages sent since the last one"""
+    try:
+        log_chat = refresh_journal(current_user.id)
+    except Exception as e:
+        logger.error(f"Journal refresh failed for user {current_user.id}: {e}")
+        return jsonify({"error": "Failed to update the journal"}), 502
+    
+    if log_chat is None:
+        return jsonify({"updated": False}), 200
+    
+    return jsonify({
+        "updated": True,
+        "entry": {
+            'content': log_chat.message,
+            'timestamp': log_chat.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        }
+    }), 200
+
+
+@app.route('/search')
+@login_required
+def search_history():
+    """
+    Ranked full-text search over the user's messages and journal entries,
+    including archived ones. `types` is a comma-separated subset of
+    user, assistant and log (all by default); `page` goes up to
+    SEARCH_MAX_PAGES and `limit` up to SEARCH_PAGE_SIZE_MAX. Anything else
+    is a 400.
+    """
+    query = request.args.get('q', '').strip()
+    if not search.search_terms(query):
+        return jsonify({"error": "Search query is required"}), 400
+    
+    types = request.args.get('types')
+    types = [t.strip() for t in types.split(',')] if types else search.SEARCH_TYPES
+    unknown = [t for t in types if t not in search.SEARCH_TYPES]
+    if unknown:
+        return jsonify({
+            "error": f"Unknown types: {', '.join(unknown)}; expected a subset of {', '.join(search.SEARCH_TYPES)}"
+        }), 400
     
-    return render_template('journal.html', journal_entries=journal_entries)
+    page = int_arg('page', 1, maximum=Config.SEARCH_MAX_PAGES)
+    per_page = int_arg('limit', Config.SEARCH_PAGE_SIZE, maximum=Config.SEARCH_PAGE_SIZE_MAX)
+    
+    results, has_more = search.search_messages(current_user.id, query, types=types, page=page, per_page=per_page)
+    next_page = page + 1 if has_more and page < Config.SEARCH_MAX_PAGES else None
+    return jsonify(results=results, page=page, next_page=next_page)
 
 
 @app.route('/morevoice')
 @login_required
 def morevoice():
-    return render_template('morevoice.html')
+    return render_template('morevoice.html', stt_max_duration=Config.STT_MAX_DURATION)
 
 
 @app.route('/tts')
@@ -344,53 +606,138 @@ def tts():
     if not text:
         return jsonify({"error": "No text provided"}), 400
 
-    speech_file_path = speech_folder / "speech.mp3"
-    with client.audio.speech.with_streaming_response.create(
-        model="gpt-4o-mini-tts",
-        voice="alloy",
-        input=text,
-        instructions="""Voice Affect:
-Calm, composed, and deeply empathetic. A steady, reassuring presence that conveys safety and understanding. The voice should exude competence and emotional attunement, fostering trust and openness.
-Tone:
-Warm, nonjudgmental, and reflective. Sincere with gentle curiosity—never rushed or authoritative. A balance of professionalism and human connection, validating emotions while guiding insight.
-Pacing:
-Slow to moderate, allowing space for processing emotions and thoughts. Deliberate pauses after important reflections or questions to let words resonate. Slightly quicker when summarizing or transitioning to action steps, signaling structure and forward movement.
-Emotions:
-Empathic attunement (reflecting care and deep listening), gentle encouragement (supporting growth without pressure), and grounded stability (a steady anchor in distress).
-Pronunciation:
-Clear and measured, with careful articulation to ensure key therapeutic phrases land effectively (e.g., "How does that feel for you?" or "Let’s explore that together."). Softened inflection when addressing sensitive topics.
-Pauses:
-Before reflective statements to invite contemplation.
-After emotionally charged disclosures to honor the weight of the moment.
-Between questions to avoid overwhelming the client.
-"""
-    ) as response:
-        response.stream_to_file(speech_file_path)
-
-    return send_file(speech_file_path, mimetype="audio/mpeg")
+    key, audio = synthesize_cached(text)
+    stat = os.fstat(audio.fileno())
+    
+    # The file is sent from the open handle, so evicting it from the cache
+    # meanwhile cannot fail the response. Content-addressed files never
+    # change, so the key is a strong ETag; send_file only does If-None-Match
+    # and Range handling for paths, so it is applied here with the size.
+    response = send_file(
+        audio,
+        mimetype="audio/mpeg",
+        etag=key,
+        last_modified=stat.st_mtime,
+        max_age=Config.TTS_CACHE_MAX_AGE
+    )
+    return response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+
+
+def audio_upload():
+    """
+    Validate the 'audio' upload of the current request.
+
+    Returns (upload, None), or (None, error response) after closing a
+    rejected upload.
+    """
+    # Enforced while the body is read, so an oversized upload is never buffered
+    request.max_content_length = Config.STT_MAX_BYTES
+    try:
+        audio_file = request.files.get('audio')
+    except RequestEntityTooLarge:
+        return None, (jsonify({"error": "Recording is too large"}), 413)
+    if audio_file is None:
+        return None, (jsonify({"error": "No audio file provided"}), 400)
+
+    duration = request.form.get('duration', type=float)
+    if duration is not None and duration > Config.STT_MAX_DURATION:
+        audio_file.close()
+        return None, (jsonify({"error": f"Recording is longer than {Config.STT_MAX_DURATION} seconds"}), 413)
+    if upload_size(audio_file) == 0:
+        audio_file.close()
+        return None, (jsonify({"error": "Empty audio file"}), 400)
+    return audio_file, None
 
 
 @app.route('/stt', methods=['POST'])
 @login_required
 def stt():
-    if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
-    audio_file = request.files['audio']
-    audio_path=os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(audio_file.filename))
-    audio_file.save(audio_path)
-    with open(audio_path, "rb") as af:
-        transcription = client.audio.transcriptions.create(
-            file=af,
-            model="whisper-1"
-        )
-    text = transcription.text
-    return jsonify({"text": text})
+    audio_file, error = audio_upload()
+    if error:
+        return error
+    return jsonify({"text": transcribe_upload(audio_file)})
+
+
+@app.route('/voice/turn', methods=['POST'])
+@login_required
+def voice_turn():
+    """
+    Run a whole voice exchange in one request: transcribe the recording,
+    generate the reply and synthesize it.
+
+    Responds with newline-delimited JSON events: transcript, reply deltas,
+    the final reply, base64 mp3 audio chunks in playback order, then done.
+    """
+    audio_file, error = audio_upload()
+    if error:
+        return error
+    transcript = transcribe_upload(audio_file).strip()
+    
+    turn = None
+    if transcript:
+        try:
+            turn = chat_executor.submit(current_user.id, transcript)
+        except QueueFullError as e:
+            logger.warning(str(e))
+            return jsonify({"error": "Server is busy, please try again shortly"}), 503
+    
+    def generate():
+        yield ndjson_event({'type': 'transcript', 'text': transcript})
+        if turn is None:
+            yield ndjson_event({'type': 'done'})
+            return
+        
+        # Relay the reply as it is generated and start synthesizing its first
+        # sentence as soon as that sentence is complete
+        parts = []
+        offset = 0
+        prefetched = False
+        while True:
+            turn.wait(offset, timeout=15)
+            state = turn.snapshot(offset)
+            if state['text']:
+                offset = state['offset']
+                parts.append(state['text'])
+                yield ndjson_event({'type': 'delta', 'text': state['text']})
+                if not prefetched:
+                    sentence = first_complete_sentence(''.join(parts))
+                    if sentence:
+                        prefetch_speech(sentence)
+                        prefetched = True
+            elif not turn.done:
+                yield "\n"  # keep-alive
+            if turn.done:
+                break
+        
+        if turn.status == 'failed':
+            yield ndjson_event({'type': 'error', 'error': turn.error})
+            return
+        yield ndjson_event({'type': 'reply', 'message': turn.message, 'duplicate': turn.duplicate})
+        
+        if turn.message:
+            chunks = synthesize_chunks(turn.message)
+            try:
+                for chunk in chunks:
+                    yield ndjson_event({'type': 'audio', 'data': base64.b64encode(chunk).decode('ascii')})
+            except Exception as e:
+                logger.error(f"Speech synthesis failed for voice turn {turn.id}: {e}")
+                yield ndjson_event({'type': 'error', 'error': "Failed to synthesize speech"})
+                return
+            finally:
+                chunks.close()
+        yield ndjson_event({'type': 'done'})
+    
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 
 if __name__ == "__main__":
-    print("🚀 Starting MoreAI server...")
-    print("📍 Server will be available at: http://localhost:8000")
-    print("🔍 Health check: http://localhost:8000/health")
-    print("🔐 Admin login: admin / Admin123!")
-    print("=" * 50)
-    serve(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    logger.info("Starting MoreAI server at http://localhost:8000 (health check: /health)")
+    metrics.SERVER_THREADS.set(Config.WAITRESS_THREADS, server='waitress')
+    serve(app, host="0.0.0.0", port=8000, threads=Config.WAITRESS_THREADS)
\ No newline at end of file
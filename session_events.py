@@ -0,0 +1,40 @@
+"""
+Apply ORM changes to in-process state once their transaction commits.
+
+Caches and counters collect what a flush touched into session.info, act on
+it after the commit, and forget it (or drop the affected entries) on
+rollback. Bulk query.delete()/update() statements do not flush objects and
+are not seen here.
+"""
+
+from sqlalchemy import event
+
+from models import db
+
+
+def on_commit(name, collect, apply, discard=None, factory=set):
+    """
+    Register flush/commit/rollback listeners on db.session.
+
+    collect(session, pending) runs after every flush and adds what it needs
+    to `pending` (a `factory()` kept in session.info until the transaction
+    ends); apply(pending) runs after the commit and discard(pending), if
+    given, after a rollback.
+    """
+    key = f'{name}_pending'
+
+    @event.listens_for(db.session, 'after_flush')
+    def _collect_changes(session, flush_context):
+        collect(session, session.info.setdefault(key, factory()))
+
+    @event.listens_for(db.session, 'after_commit')
+    def _apply_changes(session):
+        pending = session.info.pop(key, None)
+        if pending:
+            apply(pending)
+
+    @event.listens_for(db.session, 'after_rollback')
+    def _discard_changes(session):
+        pending = session.info.pop(key, None)
+        if pending and discard is not None:
+            discard(pending)
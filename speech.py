@@ -0,0 +1,314 @@
+"""
+Speech synthesis helpers.
+
+Synthesized audio is cached on disk under a content hash of everything that
+determines it (text, voice, model, instructions), so replaying the same reply
+is a file read instead of an upstream call. The cache is size-capped with
+least-recently-used eviction.
+
+Long replies can also be synthesized sentence by sentence on a bounded pool
+and streamed back in order, so playback starts after the first sentence.
+Each reply keeps at most TTS_CHUNKS_PER_REPLY sentences on the pool, so one
+long reply cannot hold every worker.
+
+Recordings for transcription never touch the uploads directory: they are
+spooled in memory (spilling to a private temp file only when large) and
+handed to the transcription call directly.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from flask import Request
+from werkzeug.utils import secure_filename
+
+from config import Config
+import gateway
+import metrics
+
+TTS_MODEL = "gpt-4o-mini-tts"
+TTS_VOICE = "alloy"
+TTS_INSTRUCTIONS = """Voice Affect:
+Calm, composed, and deeply empathetic. A steady, reassuring presence that conveys safety and understanding. The voice should exude competence and emotional attunement, fostering trust and openness.
+Tone:
+Warm, nonjudgmental, and reflective. Sincere with gentle curiosity—never rushed or authoritative. A balance of professionalism and human connection, validating emotions while guiding insight.
+Pacing:
+Slow to moderate, allowing space for processing emotions and thoughts. Deliberate pauses after important reflections or questions to let words resonate. Slightly quicker when summarizing or transitioning to action steps, signaling structure and forward movement.
+Emotions:
+Empathic attunement (reflecting care and deep listening), gentle encouragement (supporting growth without pressure), and grounded stability (a steady anchor in distress).
+Pronunciation:
+Clear and measured, with careful articulation to ensure key therapeutic phrases land effectively (e.g., "How does that feel for you?" or "Let’s explore that together."). Softened inflection when addressing sensitive topics.
+Pauses:
+Before reflective statements to invite contemplation.
+After emotionally charged disclosures to honor the weight of the moment.
+Between questions to avoid overwhelming the client.
+"""
+
+
+def cache_key(text, voice=TTS_VOICE, model=TTS_MODEL, instructions=TTS_INSTRUCTIONS):
+    payload = json.dumps([model, voice, instructions, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    Content-addressed mp3 files with a total size cap and LRU eviction.
+
+    The cache keeps a running total of the bytes it has written and only
+    scans the directory once that crosses max_bytes; eviction then goes down
+    to EVICT_TARGET of the cap so the next scan is many writes away. Files
+    are handed out open, so one evicted while it is being sent is still read
+    in full.
+    """
+
+    EVICT_TARGET = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._size_lock = threading.Lock()
+        self._bytes = 0
+        self.evict()
+
+    def path_for(self, key):
+        return self.directory / f"{key}.mp3"
+
+    def get(self, key):
+        """Return the cached file for key opened for reading, or None on a miss"""
+        path = self.path_for(key)
+        try:
+            audio = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            # mtime doubles as the LRU clock
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return audio
+
+    def put(self, key, audio):
+        """Atomically store audio under key, evict old entries if needed and return it opened"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(audio)
+            os.replace(tmp_path, self.path_for(key))
+            stored = open(self.path_for(key), 'rb')
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._size_lock:
+            self._bytes += len(audio)
+            full = self._bytes > self.max_bytes
+        if full:
+            self.evict()
+        return stored
+
+    def get_or_create(self, key, synthesize):
+        """
+        Return the file for key opened for reading, calling synthesize() to
+        produce the audio on a miss. Concurrent misses for the same key
+        synthesize only once. The caller closes the file.
+        """
+        audio = self.get(key)
+        if audio is not None:
+            metrics.TTS_CACHE_LOOKUPS.inc(result='hit')
+            return audio
+        metrics.TTS_CACHE_LOOKUPS.inc(result='miss')
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                audio = self.get(key)
+                if audio is None:
+                    audio = self.put(key, synthesize())
+                return audio
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    def evict(self):
+        """
+        Recount the cache from disk and, if it is over max_bytes, delete least
+        recently used files until it is down to EVICT_TARGET of it
+        """
+        with self._size_lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.mp3'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            if total > self.max_bytes:
+                target = self.max_bytes * self.EVICT_TARGET
+                for _, size, path in sorted(entries):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    if total <= target:
+                        break
+            self._bytes = total
+
+
+tts_cache = TTSCache(Config.TTS_CACHE_DIR, Config.TTS_CACHE_MAX_BYTES)
+
+
+def synthesize_cached(text, voice=TTS_VOICE, model=TTS_MODEL, instructions=TTS_INSTRUCTIONS):
+    """
+    Return (cache key, open mp3 file) for text, synthesizing it on a cache
+    miss. The caller closes the file.
+    """
+    key = cache_key(text, voice, model, instructions)
+
+    def synthesize():
+        audio = gateway.synthesize_speech(
+            model=model,
+            voice=voice,
+            input=text,
+            instructions=instructions
+        )
+        metrics.TTS_AUDIO_BYTES.observe(len(audio))
+        return audio
+
+    return key, tts_cache.get_or_create(key, synthesize)
+
+
+def _warm_cache(text):
+    _, audio = synthesize_cached(text)
+    audio.close()
+
+
+# Sentence ends: terminal punctuation (optionally followed by closing quotes or
+# brackets) and whitespace, or a line break
+SENTENCE_END = re.compile(r'(?<=[.!?…])["»)\]]*\s+|\n+')
+
+_chunk_pool = ThreadPoolExecutor(max_workers=Config.TTS_WORKERS, thread_name_prefix='tts')
+
+
+def split_sentences(text, max_chars=None):
+    """
+    Split text into synthesis chunks along sentence boundaries.
+
+    The first sentence is kept on its own so audio can start as early as
+    possible; later sentences are merged up to max_chars per chunk.
+    """
+    max_chars = max_chars or Config.TTS_CHUNK_MAX_CHARS
+    sentences = [part.strip() for part in SENTENCE_END.split(text) if part and part.strip()]
+    if not sentences:
+        return []
+
+    chunks = [sentences[0]]
+    current = ''
+    for sentence in sentences[1:]:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def first_complete_sentence(text):
+    """The first chunk split_sentences() will produce, once partial text has finished it"""
+    parts = [part.strip() for part in SENTENCE_END.split(text)]
+    # The last part may still be growing
+    complete = [part for part in parts[:-1] if part]
+    return complete[0] if complete else None
+
+
+def prefetch_speech(text):
+    """
+    Start synthesizing text on the TTS pool without waiting for it.
+
+    The result lands in the disk cache, so a later synthesize_cached() or
+    synthesize_chunks() call for the same text reuses it (or waits for it).
+    """
+    return _chunk_pool.submit(_warm_cache, text)
+
+
+def _close_audio(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result()[1].close()
+
+
+def synthesize_chunks(text):
+    """
+    Yield mp3 audio for text chunk by chunk, in order.
+
+    Up to TTS_CHUNKS_PER_REPLY chunks are on the shared TTS pool at a time,
+    the next one submitted as each is yielded. Closing the generator cancels
+    chunks that have not started yet.
+    """
+    chunks = iter(split_sentences(text))
+    futures = deque()
+    try:
+        while True:
+            for chunk in islice(chunks, Config.TTS_CHUNKS_PER_REPLY - len(futures)):
+                futures.append(_chunk_pool.submit(synthesize_cached, chunk))
+            if not futures:
+                return
+            _, audio = futures.popleft().result()
+            with audio:
+                yield audio.read()
+    finally:
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(_close_audio)
+
+
+class SpooledUploadRequest(Request):
+    """Request that buffers uploaded files in memory up to STT_SPOOL_MAX_MEMORY"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Spilled files are anonymous temp files: private to this process and
+        # gone as soon as they are closed
+        return tempfile.SpooledTemporaryFile(max_size=Config.STT_SPOOL_MAX_MEMORY, mode='rb+')
+
+
+def upload_size(upload):
+    """Size in bytes of an uploaded file, leaving its stream at the start"""
+    stream = upload.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def transcribe_upload(upload, model="whisper-1"):
+    """Transcribe an uploaded recording straight from its buffer and close it"""
+    # The extension tells the API the container format
+    filename = secure_filename(upload.filename or '') or 'audio.webm'
+    metrics.STT_UPLOAD_BYTES.observe(upload_size(upload))
+    try:
+        transcription = gateway.transcribe(
+            file=(filename, upload.stream, upload.mimetype or 'application/octet-stream'),
+            model=model
+        )
+    finally:
+        upload.close()
+    return transcription.text
@@ -0,0 +1,9 @@
+#!/bin/sh
+
+# Container entrypoint. Waitress cannot hold WebSocket connections, so with the
+# real-time channel on (see realtime.py) the app is served by gunicorn's
+# threaded worker instead; its settings are in gunicorn.conf.py.
+case "$(echo "${REALTIME_ENABLED:-false}" | tr '[:upper:]' '[:lower:]')" in
+    1|true|yes) exec gunicorn server:app ;;
+    *) exec python server.py ;;
+esac
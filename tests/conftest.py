@@ -0,0 +1,75 @@
+"""
+Shared fixtures.
+
+Tests run against server.app on a throwaway SQLite database. Nothing here
+talks to OpenAI: tests that need model output replace the gateway calls
+with fakes. test_auth.py in the repository root is a separate smoke script
+for a running server and is not part of this suite.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Config reads the environment at import time, so this must come first
+TMP_DIR = tempfile.mkdtemp(prefix='moreai-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{TMP_DIR}/test.db"
+os.environ['TTS_CACHE_DIR'] = os.path.join(TMP_DIR, 'tts_cache')
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+os.environ.setdefault('CHAT_ARCHIVE_AFTER_DAYS', '0')
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+PASSWORD = 'Passw0rd!'
+
+
+@pytest.fixture(scope='session')
+def app():
+    import server
+    return server.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user with a unique name; returns (id, username)"""
+    from models import db, User
+
+    def make():
+        with app.app_context():
+            user = User(username=f'user-{uuid.uuid4().hex[:12]}')
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            db.session.commit()
+            return user.id, user.username
+
+    return make
+
+
+@pytest.fixture
+def login(client, make_user):
+    """Log a new user in on `client`; returns (user id, login response JSON)"""
+    def log_in(remember=False):
+        user_id, username = make_user()
+        response = client.post('/auth/login', json={
+            'username': username, 'password': PASSWORD, 'remember': remember
+        })
+        assert response.status_code == 200
+        return user_id, response.get_json()
+
+    return log_in
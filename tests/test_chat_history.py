@@ -0,0 +1,35 @@
+import pytest
+
+from config import Config
+from models import db, Chat
+
+XHR = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+@pytest.fixture
+def history(app, client, login):
+    """A logged-in client whose user has five messages; returns their ids, oldest first"""
+    user_id, _ = login()
+    with app.app_context():
+        chats = [Chat(user_id=user_id, message=f'message {i}', message_type='user') for i in range(5)]
+        db.session.add_all(chats)
+        db.session.commit()
+        return [chat.id for chat in chats]
+
+
+def test_history_pages_by_cursor(client, history):
+    first = client.get('/chat?limit=2', headers=XHR).get_json()
+    assert [msg['id'] for msg in first['history']] == history[3:]
+
+    second = client.get(f"/chat?limit=2&before={first['next_before']}", headers=XHR).get_json()
+    assert [msg['id'] for msg in second['history']] == history[1:3]
+
+
+@pytest.mark.parametrize('query', [
+    'limit=0', 'limit=-5', 'limit=abc', f'limit={Config.CHAT_PAGE_SIZE_MAX + 1}', 'before=0', 'before=x'
+])
+def test_invalid_paging_is_rejected(client, history, query):
+    response = client.get(f'/chat?{query}', headers=XHR)
+
+    assert response.status_code == 400
+    assert 'must be a number' in response.get_json()['error']
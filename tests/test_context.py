@@ -0,0 +1,157 @@
+import pytest
+
+import context
+import gateway
+import history_cache
+import more
+from config import Config
+from models import db, Chat, ConversationSummary
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    """One token per word, a one-token system prompt and a small budget"""
+    monkeypatch.setattr(context, 'count_tokens', lambda text: len(text.split()) if text else 0)
+    monkeypatch.setattr(context, 'SYSTEM_PROMPT', 'system')
+    monkeypatch.setattr(Config, 'CONTEXT_TOKEN_BUDGET', 100)
+    monkeypatch.setattr(Config, 'CONTEXT_KEEP_TOKENS', 40)
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    """Replace the summarization call; records (previous summary, folded ids)"""
+    calls = []
+
+    def fake_summarize(previous_summary, folded):
+        calls.append((previous_summary, [msg['id'] for msg in folded]))
+        return f'summary {len(calls)}'
+
+    monkeypatch.setattr(context, 'summarize_history', fake_summarize)
+    return calls
+
+
+def add_turns(user_id, count, start=0):
+    """Alternating user/assistant messages of ten words each (14 tokens with framing)"""
+    chats = [
+        Chat(user_id=user_id, message=' '.join([f'm{i}'] * 10), message_type='user' if i % 2 == 0 else 'assistant')
+        for i in range(start, start + count)
+    ]
+    db.session.add_all(chats)
+    db.session.commit()
+    return [chat.id for chat in chats]
+
+
+def test_history_within_budget_is_sent_as_is(app_context, make_user, word_tokens, summaries):
+    user_id, _ = make_user()
+    ids = add_turns(user_id, 6)
+
+    conversation = context.build_context(user_id, 'hi')
+
+    assert summaries == []
+    assert conversation.summary is None
+    assert [msg['id'] for msg in conversation.history] == ids
+
+
+def test_budget_overflow_folds_old_turns_into_the_summary(app_context, make_user, word_tokens, summaries):
+    user_id, _ = make_user()
+    ids = add_turns(user_id, 10)
+
+    conversation = context.build_context(user_id, 'hi')
+
+    # 10 x 14 tokens overflow the budget; the newest 40 tokens (2 turns) stay
+    assert summaries == [(None, ids[:8])]
+    assert conversation.summary == 'summary 1'
+    assert [msg['id'] for msg in conversation.history] == ids[8:]
+    state = db.session.get(ConversationSummary, user_id)
+    assert (state.summary, state.covered_until_id) == ('summary 1', ids[7])
+
+
+def test_checkpoint_moves_forward_without_losing_messages(app_context, make_user, word_tokens, summaries):
+    user_id, _ = make_user()
+    ids = add_turns(user_id, 10)
+    context.build_context(user_id, 'hi')
+
+    # Six unsummarized turns still fit next to the summary
+    ids += add_turns(user_id, 4, start=10)
+    conversation = context.build_context(user_id, 'hi')
+    assert len(summaries) == 1
+    assert [msg['id'] for msg in conversation.history] == ids[8:]
+
+    ids += add_turns(user_id, 2, start=14)
+    conversation = context.build_context(user_id, 'hi')
+
+    assert summaries[1] == ('summary 1', ids[8:14])
+    folded = [chat_id for _, folded_ids in summaries for chat_id in folded_ids]
+    assert folded + [msg['id'] for msg in conversation.history] == ids
+    assert db.session.get(ConversationSummary, user_id).covered_until_id == ids[13]
+
+
+def test_kept_window_starts_on_a_user_turn(app_context, make_user, word_tokens, summaries, monkeypatch):
+    monkeypatch.setattr(Config, 'CONTEXT_KEEP_TOKENS', 50)
+    user_id, _ = make_user()
+    ids = add_turns(user_id, 10)
+
+    conversation = context.build_context(user_id, 'hi')
+
+    # 50 tokens fit three turns, but the oldest of them is an assistant reply
+    assert summaries == [(None, ids[:8])]
+    assert conversation.history[0]['type'] == 'user'
+
+
+def test_failed_summary_keeps_the_checkpoint(app_context, make_user, word_tokens, monkeypatch):
+    monkeypatch.setattr(context, 'summarize_history', lambda previous, folded: None)
+    user_id, _ = make_user()
+    ids = add_turns(user_id, 10)
+
+    conversation = context.build_context(user_id, 'hi')
+
+    assert [msg['id'] for msg in conversation.history] == ids[8:]
+    assert db.session.get(ConversationSummary, user_id) is None
+    assert history_cache.get_state(user_id).covered_until_id == 0
+
+
+def test_summarize_history_merges_the_previous_summary(monkeypatch):
+    requests = []
+
+    class Response:
+        choices = [type('Choice', (), {'message': type('Message', (), {'content': 'merged'})})]
+
+    monkeypatch.setattr(gateway, 'chat_completion', lambda **kwargs: requests.append(kwargs) or Response)
+
+    summary = more.summarize_history('earlier', [
+        {'message': 'I feel tired', 'type': 'user'},
+        {'message': 'That sounds hard', 'type': 'assistant'},
+    ])
+
+    assert summary == 'merged'
+    assert requests[0]['operation'] == 'summary'
+    prompt = requests[0]['messages'][-1]['content']
+    assert 'earlier' in prompt
+    assert 'User: I feel tired\nAssistant: That sounds hard' in prompt
+
+
+def test_summarize_history_returns_none_on_upstream_errors(monkeypatch):
+    def fail(**kwargs):
+        raise gateway.CircuitOpenError('open')
+
+    monkeypatch.setattr(gateway, 'chat_completion', fail)
+
+    assert more.summarize_history(None, [{'message': 'hi', 'type': 'user'}]) is None
+
+
+def test_missing_tokenizer_logs_a_warning_and_estimates(monkeypatch, caplog):
+    import tiktoken
+
+    def offline(model_name):
+        raise ConnectionError('no network')
+
+    monkeypatch.setattr(tiktoken, 'encoding_for_model', offline)
+    context.get_tokenizer.cache_clear()
+    context.count_tokens.cache_clear()
+    try:
+        with caplog.at_level('WARNING', logger='context'):
+            assert context.count_tokens('x' * 40) == 11
+        assert 'estimating token counts' in caplog.text
+    finally:
+        context.get_tokenizer.cache_clear()
+        context.count_tokens.cache_clear()
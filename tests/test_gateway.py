@@ -0,0 +1,216 @@
+import httpx
+import openai
+import pytest
+
+import gateway
+from config import Config
+from gateway import CircuitBreaker, CircuitOpenError
+
+REQUEST = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+
+
+def connection_error():
+    return openai.APIConnectionError(request=REQUEST)
+
+
+def status_error(error_class, status_code):
+    return error_class('upstream said no', response=httpx.Response(status_code, request=REQUEST), body=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class FakeUpstream:
+    """Stands in for fn(client, timeout): raises the queued errors, then returns 'ok'"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, client, timeout):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    monkeypatch.setattr(gateway, 'breaker', breaker)
+    return breaker
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Record backoff delays instead of sleeping; no real client is created"""
+    delays = []
+    monkeypatch.setattr(gateway, 'get_client', lambda: object())
+    monkeypatch.setattr(gateway, 'backoff_delay', lambda attempt: delays.append(attempt) or 0)
+    monkeypatch.setattr(Config, 'OPENAI_MAX_RETRIES', 2)
+    return delays
+
+
+# --- circuit breaker ----------------------------------------------------------
+
+def test_breaker_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 1
+
+
+def test_half_open_lets_one_probe_through_after_the_reset_timeout(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(29)
+    assert not breaker.allow()
+
+    clock.advance(1)
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_the_breaker(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_reset_timeout(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30)
+    assert breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+
+
+# --- retries ------------------------------------------------------------------
+
+@pytest.mark.parametrize('error', [
+    connection_error(),
+    status_error(openai.RateLimitError, 429),
+    status_error(openai.InternalServerError, 500),
+])
+def test_transient_errors_are_retried(breaker, delays, error):
+    upstream = FakeUpstream(error)
+
+    assert gateway.call('chat', upstream) == 'ok'
+    assert upstream.calls == 2
+    assert delays == [0]
+    assert breaker.failures == 0
+
+
+def test_retries_stop_after_max_retries(breaker, delays):
+    upstream = FakeUpstream(*(connection_error() for _ in range(5)))
+
+    with pytest.raises(openai.APIConnectionError):
+        gateway.call('chat', upstream)
+
+    assert upstream.calls == Config.OPENAI_MAX_RETRIES + 1
+    assert delays == [0, 1]
+    assert breaker.failures == 3
+
+
+@pytest.mark.parametrize('error', [
+    status_error(openai.BadRequestError, 400),
+    status_error(openai.AuthenticationError, 401),
+    ValueError('bad arguments'),
+])
+def test_client_errors_are_not_retried_or_counted(breaker, delays, error):
+    breaker.record_failure()
+    upstream = FakeUpstream(error)
+
+    with pytest.raises(type(error)):
+        gateway.call('chat', upstream)
+
+    assert upstream.calls == 1
+    assert delays == []
+    assert breaker.failures == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_error_on_the_probe_keeps_the_breaker_half_open(breaker, clock, delays):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.advance(30)
+
+    with pytest.raises(openai.BadRequestError):
+        gateway.call('chat', FakeUpstream(status_error(openai.BadRequestError, 400)))
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # The probe slot is free again for the next call
+    assert gateway.call('chat', FakeUpstream()) == 'ok'
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_fails_fast_without_calling_upstream(breaker, delays):
+    for _ in range(3):
+        breaker.record_failure()
+    upstream = FakeUpstream()
+
+    with pytest.raises(CircuitOpenError):
+        gateway.call('chat', upstream)
+
+    assert upstream.calls == 0
+
+
+def test_breaker_opening_mid_retry_stops_the_retries(breaker, delays):
+    breaker.record_failure()
+    upstream = FakeUpstream(*(connection_error() for _ in range(5)))
+
+    # Failures 2 and 3 open the breaker before the third attempt
+    with pytest.raises(CircuitOpenError):
+        gateway.call('chat', upstream)
+
+    assert upstream.calls == 2
+
+
+def test_backoff_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(gateway.random, 'uniform', lambda low, high: high)
+    monkeypatch.setattr(Config, 'OPENAI_RETRY_BASE_DELAY', 0.5)
+    monkeypatch.setattr(Config, 'OPENAI_RETRY_MAX_DELAY', 4)
+
+    assert [gateway.backoff_delay(attempt) for attempt in range(5)] == [0.5, 1, 2, 4, 4]
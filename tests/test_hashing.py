@@ -0,0 +1,63 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import hashing
+
+
+class DeadPool:
+    """Stands in for a process pool whose worker has died"""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker died'))
+        return future
+
+
+@pytest.fixture
+def dead_pool(monkeypatch):
+    pool = DeadPool()
+    monkeypatch.setattr(hashing, '_pool', pool)
+    monkeypatch.setattr(hashing, '_broken', False)
+    return pool
+
+
+def test_hashing_works_on_the_real_pool():
+    pwhash = hashing.hash_password('secret')
+
+    assert hashing.verify_password(pwhash, 'secret') == (True, False)
+    assert hashing.verify_password(pwhash, 'wrong') == (False, False)
+
+
+def test_broken_pool_fails_fast_without_forking_a_new_one(dead_pool):
+    with pytest.raises(hashing.HashingBusyError):
+        hashing.hash_password('secret')
+    assert hashing.is_broken()
+
+    with pytest.raises(hashing.HashingBusyError):
+        hashing.hash_password('secret')
+    assert dead_pool.submitted == 1
+    assert hashing._pool is dead_pool
+
+
+def test_broken_pool_fails_the_health_probes(client, make_user, request):
+    _, username = make_user()
+    request.getfixturevalue('dead_pool')
+
+    response = client.post('/auth/login', json={'username': username, 'password': 'whatever'})
+    assert response.status_code == 503
+
+    ready = client.get('/health/ready')
+    assert ready.status_code == 503
+    assert ready.get_json()['password_hashing'] == 'unavailable'
+    assert client.get('/health/live').status_code == 503
+
+
+def test_health_probes_pass_with_a_working_pool(client):
+    assert client.get('/health/live').status_code == 200
+    assert client.get('/health/ready').get_json()['password_hashing'] == 'ok'
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import history_cache
+from config import Config
+from models import db, Chat
+
+
+def message(chat_id):
+    return {'id': chat_id, 'message': f'message {chat_id}', 'type': 'user', 'timestamp': datetime.utcnow().isoformat()}
+
+
+def test_commit_appends_to_the_cached_state(app_context, make_user):
+    user_id, _ = make_user()
+    history_cache.get_state(user_id)
+
+    db.session.add(Chat(user_id=user_id, message='hello', message_type='user'))
+    db.session.commit()
+
+    cached = history_cache.cache.get(user_id)
+    assert [msg['message'] for msg in cached.messages] == ['hello']
+
+
+def test_rollback_drops_the_cached_user(app_context, make_user):
+    user_id, _ = make_user()
+    history_cache.get_state(user_id)
+    assert history_cache.cache.get(user_id) is not None
+
+    db.session.add(Chat(user_id=user_id, message='never committed', message_type='user'))
+    db.session.flush()
+    db.session.rollback()
+
+    assert history_cache.cache.get(user_id) is None
+    assert history_cache.get_state(user_id).messages == []
+
+
+def test_load_racing_a_commit_is_not_stored(app_context, make_user, monkeypatch):
+    user_id, _ = make_user()
+    load_state = history_cache.load_state
+
+    def load_then_commit(user_id):
+        state = load_state(user_id)
+        # Another request commits a message while this load is in flight
+        db.session.add(Chat(user_id=user_id, message='written meanwhile', message_type='user'))
+        db.session.commit()
+        return state
+
+    monkeypatch.setattr(history_cache, 'load_state', load_then_commit)
+    stale = history_cache.get_state(user_id)
+
+    assert stale.messages == []
+    assert history_cache.cache.get(user_id) is None
+
+
+def test_put_after_invalidate_is_ignored():
+    cache = history_cache.TTLCache(max_entries=10, ttl=60)
+    generation = cache.generation(1)
+    cache.invalidate(1)
+
+    cache.put(1, 'stale', generation)
+
+    assert cache.get(1) is None
+
+
+def test_trim_keeps_a_full_newest_page(monkeypatch):
+    monkeypatch.setattr(Config, 'HISTORY_CACHE_MAX_MESSAGES', 3)
+    monkeypatch.setattr(Config, 'CHAT_PAGE_SIZE', 5)
+    state = history_cache.ConversationState('summary', 100, [message(i) for i in range(1, 21)], 0)
+
+    state.add_message(message(21))
+
+    page, has_more = state.newest_page(5)
+    assert [msg['id'] for msg in page] == [17, 18, 19, 20, 21]
+    assert has_more
+    assert state.floor_id == 15
+
+
+def test_trim_keeps_messages_after_the_summary_checkpoint(monkeypatch):
+    monkeypatch.setattr(Config, 'HISTORY_CACHE_MAX_MESSAGES', 3)
+    monkeypatch.setattr(Config, 'CHAT_PAGE_SIZE', 2)
+    state = history_cache.ConversationState('summary', 10, [message(i) for i in range(1, 21)], 0)
+
+    state.add_message(message(21))
+
+    # Messages after covered_until_id feed the model context and stay
+    assert state.messages_after(10) == [message_ for message_ in state.messages if message_['id'] > 10]
+    assert len(state.messages_after(10)) == 11
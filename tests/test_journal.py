@@ -0,0 +1,119 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import journal
+from config import Config
+from models import db, Chat, JournalWatermark
+
+
+def add_chat(user_id, message, timestamp):
+    chat = Chat(user_id=user_id, message=message, message_type='user', timestamp=timestamp)
+    db.session.add(chat)
+    db.session.commit()
+    return chat
+
+
+def test_first_refresh_starts_at_today(app_context, make_user, monkeypatch):
+    user_id, _ = make_user()
+    add_chat(user_id, 'two months ago', datetime.utcnow() - timedelta(days=60))
+    today = add_chat(user_id, 'this morning', datetime.utcnow())
+    sent = []
+    monkeypatch.setattr(journal, 'generate_log', lambda history, previous_log=None: sent.append(history) or 'log')
+
+    log_chat = journal.refresh_journal(user_id)
+
+    assert [msg['message'] for msg in sent[0]] == ['this morning']
+    assert log_chat.message == 'log'
+    assert db.session.get(JournalWatermark, user_id).last_chat_id == today.id
+
+
+def test_refresh_continues_from_the_watermark(app_context, make_user, monkeypatch):
+    user_id, _ = make_user()
+    covered = add_chat(user_id, 'already journaled', datetime.utcnow() - timedelta(days=3))
+    add_chat(user_id, 'since then', datetime.utcnow() - timedelta(days=2))
+    db.session.add(JournalWatermark(user_id=user_id, last_chat_id=covered.id))
+    db.session.commit()
+    sent = []
+    monkeypatch.setattr(journal, 'generate_log', lambda history, previous_log=None: sent.append(history) or 'log')
+
+    journal.refresh_journal(user_id)
+
+    assert [msg['message'] for msg in sent[0]] == ['since then']
+
+
+def test_refresh_without_new_messages_does_nothing(app_context, make_user, monkeypatch):
+    user_id, _ = make_user()
+    add_chat(user_id, 'long ago', datetime.utcnow() - timedelta(days=60))
+    monkeypatch.setattr(journal, 'generate_log', lambda *args, **kwargs: None)
+
+    assert journal.refresh_journal(user_id) is None
+
+
+@pytest.fixture
+def flaky_log(monkeypatch):
+    """generate_log that fails for histories mentioning 'fail'; records every history it saw"""
+    seen = []
+
+    def generate(history, previous_log=None):
+        seen.append([msg['message'] for msg in history])
+        if any('fail' in msg['message'] for msg in history):
+            raise RuntimeError('upstream error')
+        return 'log'
+
+    monkeypatch.setattr(journal, 'generate_log', generate)
+    return seen
+
+
+def test_run_with_failures_is_retried(app_context, make_user, flaky_log, monkeypatch):
+    run_date = date(2020, 1, 1)
+    ok_user, _ = make_user()
+    failing_user, _ = make_user()
+    add_chat(ok_user, 'fine', datetime(2020, 1, 1, 10))
+    failed_chat = add_chat(failing_user, 'fail once', datetime(2020, 1, 1, 11))
+
+    run = journal.run_daily_journals(run_date)
+    assert (run.status, run.users_done, run.users_failed) == ('incomplete', 1, 1)
+
+    # Not retried before JOURNAL_RETRY_INTERVAL has passed
+    journal.run_daily_journals(run_date)
+    assert len(flaky_log) == 2
+
+    failed_chat.message = 'better now'
+    db.session.commit()
+    monkeypatch.setattr(Config, 'JOURNAL_RETRY_INTERVAL', 0)
+    run = journal.run_daily_journals(run_date)
+
+    assert flaky_log[-1] == ['better now']
+    assert (run.status, run.users_done, run.users_failed) == ('completed', 2, 0)
+    assert db.session.get(JournalWatermark, failing_user).last_chat_id == failed_chat.id
+
+
+def test_next_run_covers_the_day_a_new_user_failed(app_context, make_user, flaky_log):
+    user_id, _ = make_user()
+    failed_chat = add_chat(user_id, 'fail', datetime(2020, 2, 1, 10))
+
+    journal.run_daily_journals(date(2020, 2, 1))
+    failed_chat.message = 'first day'
+    db.session.commit()
+    add_chat(user_id, 'second day', datetime(2020, 2, 2, 10))
+    run = journal.run_daily_journals(date(2020, 2, 2))
+
+    assert run.status == 'completed'
+    assert flaky_log[-1] == ['first day', 'second day']
+
+
+@pytest.mark.parametrize('page', ['0', '-1', 'abc'])
+def test_invalid_journal_page_is_rejected(client, login, page):
+    login()
+
+    response = client.get('/journal', query_string={'page': page})
+
+    assert response.status_code == 400
+    assert 'page must be a number' in response.get_json()['error']
+
+
+def test_journal_first_page_renders(client, login):
+    login()
+
+    assert client.get('/journal?page=1').status_code == 200
@@ -0,0 +1,58 @@
+import runpy
+from pathlib import Path
+from types import SimpleNamespace
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_dropped_log_records_are_exported(client):
+    assert '\nlog_records_dropped 0\n' in scrape(client)
+
+
+def test_gunicorn_worker_reports_its_threads(client):
+    settings = runpy.run_path(Path(__file__).parent.parent / 'gunicorn.conf.py')
+    settings['post_worker_init'](SimpleNamespace(cfg=SimpleNamespace(threads=7)))
+
+    assert '\nhttp_server_threads{server="gunicorn"} 7\n' in scrape(client)
+
+
+def sample(client, name):
+    for line in scrape(client).splitlines():
+        if line.startswith(f'{name} '):
+            return float(line.split()[1])
+    return None
+
+
+def test_history_cache_stats_are_exported(client, login):
+    login()
+    hits = sample(client, 'history_cache_hits_total')
+    misses = sample(client, 'history_cache_misses_total')
+
+    client.get('/chat')
+    client.get('/chat')
+
+    assert sample(client, 'history_cache_misses_total') == misses + 1
+    assert sample(client, 'history_cache_hits_total') == hits + 1
+    assert sample(client, 'history_cache_entries') >= 1
+    assert '# TYPE history_cache_hits_total counter' in scrape(client)
+
+
+def test_user_cache_stats_are_exported(client, login):
+    login()
+    client.get('/chat')
+
+    assert sample(client, 'user_cache_entries') >= 1
+    assert sample(client, 'user_cache_hits_total') >= 1
+    assert sample(client, 'user_cache_bytes') is None
+
+
+def test_session_cache_stats_are_exported(client, login):
+    login()
+    client.get('/chat')
+
+    assert sample(client, 'session_cache_entries') >= 1
+    assert sample(client, 'session_cache_hits_total') is not None
@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from flask import Flask
+from flask_migrate import downgrade, upgrade
+
+import database
+from config import Config
+from models import db
+
+HISTORY_INDEXES = {'ix_chats_user_id_id', 'ix_chats_user_type_timestamp', 'ix_chats_user_message_hash'}
+
+
+@pytest.fixture
+def fresh_app(tmp_path):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'migrations.db'}"
+    database.init_app(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def chat_indexes():
+    return {index['name'] for index in db.inspect(db.engine).get_indexes('chats')}
+
+
+def current_revision():
+    return db.session.execute(db.text('SELECT version_num FROM alembic_version')).scalar()
+
+
+def head_revision():
+    from alembic.script import ScriptDirectory
+    from flask import current_app
+    return ScriptDirectory.from_config(current_app.extensions['migrate'].migrate.get_config()).get_current_head()
+
+
+def test_upgrade_and_downgrade_round_trip(fresh_app):
+    upgrade()
+    assert HISTORY_INDEXES <= chat_indexes()
+
+    downgrade(revision=database.BASELINE_REVISION)
+    assert not HISTORY_INDEXES & chat_indexes()
+
+    upgrade()
+    assert HISTORY_INDEXES <= chat_indexes()
+    assert current_revision() == head_revision()
+
+
+def test_database_built_by_create_all_is_stamped_and_upgraded(fresh_app):
+    db.create_all()
+
+    database.upgrade_schema()
+
+    assert current_revision() == head_revision()
+    assert HISTORY_INDEXES <= chat_indexes()
+    # Objects create_all() cannot make come from the migrations
+    assert 'chats_fts' in db.inspect(db.engine).get_table_names()
+
+
+def test_failed_upgrade_stops_startup(tmp_path):
+    script = (
+        "import database\n"
+        "def fail():\n"
+        "    raise RuntimeError('migration failed')\n"
+        "database.upgrade_schema = fail\n"
+        "import server\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=Path(__file__).resolve().parent.parent,
+        env=dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}"),
+        capture_output=True, text=True, timeout=120
+    )
+
+    assert result.returncode != 0
+    assert 'Could not upgrade the database schema' in result.stdout
+    assert 'RuntimeError: migration failed' in result.stderr
@@ -0,0 +1,50 @@
+import pytest
+
+from config import Config
+from models import db, Chat
+
+
+@pytest.fixture
+def searcher(app, client, login):
+    user_id, _ = login()
+    with app.app_context():
+        db.session.add_all([
+            Chat(user_id=user_id, message='I could not sleep last night', message_type='user'),
+            Chat(user_id=user_id, message='Sleep problems are common', message_type='assistant'),
+        ])
+        db.session.commit()
+    return client
+
+
+def test_search_filters_by_type(searcher):
+    response = searcher.get('/search?q=sleep&types=user')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result['type'] for result in body['results']] == ['user']
+    assert '<mark>sleep</mark>' in body['results'][0]['snippet']
+    assert body['page'] == 1 and body['next_page'] is None
+
+
+@pytest.mark.parametrize('types', ['users', 'user,journal', ','])
+def test_unknown_types_are_rejected(searcher, types):
+    response = searcher.get('/search', query_string={'q': 'sleep', 'types': types})
+
+    assert response.status_code == 400
+    assert 'Unknown types' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('page', ['0', '-1', 'two', str(Config.SEARCH_MAX_PAGES + 1)])
+def test_invalid_pages_are_rejected(searcher, page):
+    response = searcher.get('/search', query_string={'q': 'sleep', 'page': page})
+
+    assert response.status_code == 400
+    assert 'page' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('limit', ['0', 'abc', str(Config.SEARCH_PAGE_SIZE_MAX + 1)])
+def test_invalid_limits_are_rejected(searcher, limit):
+    response = searcher.get('/search', query_string={'q': 'sleep', 'limit': limit})
+
+    assert response.status_code == 400
+    assert 'limit' in response.get_json()['error']
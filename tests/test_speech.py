@@ -0,0 +1,92 @@
+import io
+import os
+import threading
+import time
+
+import gateway
+import speech
+from config import Config
+from speech import TTSCache
+
+
+def test_put_counts_bytes_without_scanning(tmp_path, monkeypatch):
+    cache = TTSCache(tmp_path, max_bytes=1000)
+    scans = []
+    real_evict = cache.evict
+    monkeypatch.setattr(cache, 'evict', lambda: scans.append(1) or real_evict())
+
+    for i in range(5):
+        cache.put(f'k{i}', b'x' * 100).close()
+
+    assert scans == []
+    assert cache._bytes == 500
+
+
+def test_eviction_keeps_recently_used_files(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=1000)
+    for i in range(3):
+        cache.put(f'k{i}', b'x' * 300).close()
+        # mtime is the LRU clock
+        os.utime(cache.path_for(f'k{i}'), (time.time() - 100 + i, time.time() - 100 + i))
+
+    cache.get('k0').close()
+    cache.put('k3', b'x' * 300).close()
+
+    kept = sorted(path.stem for path in tmp_path.glob('*.mp3'))
+    assert kept == ['k0', 'k2', 'k3']
+    assert cache._bytes == 900
+
+
+def test_open_file_survives_eviction(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=1000)
+    cache.put('k', b'audio').close()
+
+    audio = cache.get('k')
+    os.unlink(cache.path_for('k'))
+
+    with audio:
+        assert audio.read() == b'audio'
+    assert cache.get('k') is None
+
+
+def test_tts_supports_ranges_and_etags(client, login, monkeypatch):
+    login()
+    monkeypatch.setattr(gateway, 'synthesize_speech', lambda **kwargs: b'0123456789')
+
+    response = client.get('/tts?text=hello')
+    assert response.status_code == 200
+    assert response.data == b'0123456789'
+    etag = response.headers['ETag']
+    assert etag == f'"{speech.cache_key("hello")}"'
+
+    partial = client.get('/tts?text=hello', headers={'Range': 'bytes=2-5'})
+    assert partial.status_code == 206
+    assert partial.data == b'2345'
+    assert partial.headers['Content-Range'] == 'bytes 2-5/10'
+
+    assert client.get('/tts?text=hello', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_synthesize_chunks_limits_chunks_in_flight(monkeypatch):
+    monkeypatch.setattr(Config, 'TTS_CHUNKS_PER_REPLY', 2)
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def fake_synthesize(text):
+        with lock:
+            running.append(text)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(text)
+        return None, io.BytesIO(text.encode())
+
+    monkeypatch.setattr(speech, 'synthesize_cached', fake_synthesize)
+    text = 'One. Two. Three. Four. Five.'
+    monkeypatch.setattr(Config, 'TTS_CHUNK_MAX_CHARS', 4)
+
+    audio = list(speech.synthesize_chunks(text))
+
+    assert audio == [b'One.', b'Two.', b'Three.', b'Four.', b'Five.']
+    assert max(peak) <= 2
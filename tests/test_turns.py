@@ -0,0 +1,120 @@
+import threading
+
+import pytest
+
+import turns
+from turns import IdempotencyKeyReusedError, QueueFullError, TurnExecutor
+
+
+@pytest.fixture
+def blocked_turns(monkeypatch):
+    """Replace run_chat_turn with one that waits for the returned event"""
+    release = threading.Event()
+    calls = []
+
+    def fake_run_chat_turn(user_id, usertext, on_delta=None):
+        calls.append((user_id, usertext))
+        release.wait(5)
+        if usertext == 'fail':
+            raise RuntimeError('upstream error')
+        on_delta(f'reply to {usertext}')
+        return f'reply to {usertext}'
+
+    monkeypatch.setattr(turns, 'run_chat_turn', fake_run_chat_turn)
+    release.calls = calls
+    yield release
+    release.set()
+
+
+@pytest.fixture
+def executor(app, blocked_turns):
+    executor = TurnExecutor(app, max_workers=1, max_pending=2, result_ttl=60)
+    yield executor
+    # Finish queued turns while run_chat_turn is still the fake
+    blocked_turns.set()
+    executor._pool.shutdown(wait=True)
+
+
+def test_same_idempotency_key_returns_the_same_turn(executor, blocked_turns):
+    first = executor.submit(1, 'hello', idempotency_key='key-1')
+    retry = executor.submit(1, 'hello', idempotency_key='key-1')
+    blocked_turns.set()
+
+    assert retry is first
+    assert first.wait_done(5)
+    assert first.message == 'reply to hello'
+    assert blocked_turns.calls == [(1, 'hello')]
+
+
+def test_idempotency_key_reused_for_another_message_is_refused(executor, blocked_turns):
+    executor.submit(1, 'hello', idempotency_key='key-1')
+
+    with pytest.raises(IdempotencyKeyReusedError):
+        executor.submit(1, 'something else', idempotency_key='key-1')
+
+
+def test_reused_idempotency_key_is_a_422(client, login, blocked_turns):
+    login()
+    headers = {'Idempotency-Key': 'key-422'}
+    assert client.post('/chat/turns', json={'usertext': 'hello'}, headers=headers).status_code == 202
+
+    response = client.post('/chat/turns', json={'usertext': 'something else'}, headers=headers)
+
+    assert response.status_code == 422
+
+
+def test_idempotency_keys_are_per_user(executor, blocked_turns):
+    first = executor.submit(1, 'hello', idempotency_key='key-1')
+    other_user = executor.submit(2, 'hello', idempotency_key='key-1')
+
+    assert other_user is not first
+
+
+def test_same_message_in_flight_attaches_to_the_running_turn(executor, blocked_turns):
+    first = executor.submit(1, 'hello')
+    double_submit = executor.submit(1, 'hello')
+
+    assert double_submit is first
+
+
+def test_failed_turn_is_retried_by_resending(executor, blocked_turns):
+    failed = executor.submit(1, 'fail')
+    blocked_turns.set()
+    assert failed.wait_done(5)
+    assert failed.status == 'failed'
+
+    retry = executor.submit(1, 'fail')
+
+    assert retry is not failed
+
+
+def test_full_queue_rejects_new_turns(executor, blocked_turns):
+    executor.submit(1, 'one')
+    executor.submit(1, 'two')
+
+    with pytest.raises(QueueFullError):
+        executor.submit(1, 'three')
+    # A duplicate of a queued turn still attaches instead of being rejected
+    assert executor.submit(1, 'two').usertext == 'two'
+
+
+def test_turn_is_only_visible_to_its_user(executor, blocked_turns):
+    turn = executor.submit(1, 'hello')
+
+    assert executor.get(turn.id, 1) is turn
+    assert executor.get(turn.id, 2) is None
+
+
+def test_turn_streams_as_server_sent_events(client, login, blocked_turns):
+    login()
+    blocked_turns.set()
+    turn = client.post('/chat/turns', json={'usertext': 'hello'}).get_json()
+
+    body = client.get(turn['stream_url']).get_data(as_text=True)
+
+    assert 'id: 14\nevent: delta\ndata: {"text": "reply to hello"}' in body
+    assert 'event: done' in body
+    # A reconnect with Last-Event-ID gets only what came after it
+    resumed = client.get(turn['stream_url'], headers={'Last-Event-ID': '14'}).get_data(as_text=True)
+    assert 'event: delta' not in resumed
+    assert 'event: done' in resumed
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from config import Config
+from models import db, UserSession
+
+
+def test_remember_cookie_starts_a_new_session(app, client, login):
+    user_id, body = login(remember=True)
+
+    # The browser dropped its session cookie but kept the remember cookie
+    client.delete_cookie('session')
+    assert client.get_cookie('remember_token') is not None
+
+    response = client.get('/auth/profile')
+    assert response.status_code == 200
+    assert response.get_json()['id'] == user_id
+
+    with client.session_transaction() as flask_session:
+        new_session_id = flask_session['session_id']
+    assert new_session_id != body['session_id']
+    with app.app_context():
+        user_session = db.session.get(UserSession, new_session_id)
+        assert user_session.user_id == user_id and user_session.is_active
+        lifetime = user_session.expires_at - datetime.utcnow()
+        assert lifetime > timedelta(seconds=Config.REMEMBER_COOKIE_DURATION - 60)
+
+
+def test_without_remember_cookie_dropping_the_session_logs_out(client, login):
+    login(remember=False)
+    client.delete_cookie('session')
+
+    response = client.get('/auth/profile')
+    assert response.status_code == 302
+    assert '/auth/login' in response.headers['Location']
+
+
+def test_activity_extends_an_expiring_session(app, client, login):
+    _, body = login()
+    with app.app_context():
+        user_session = db.session.get(UserSession, body['session_id'])
+        user_session.expires_at = datetime.utcnow() + timedelta(minutes=5)
+        db.session.commit()
+
+    assert client.get('/auth/profile').status_code == 200
+
+    with app.app_context():
+        expires_at = db.session.get(UserSession, body['session_id']).expires_at
+    assert expires_at > datetime.utcnow() + timedelta(seconds=Config.SESSION_IDLE_TIMEOUT - 60)
+
+
+def test_revoked_session_logs_out(app, client, login):
+    _, body = login()
+    assert client.delete(f"/auth/sessions/{body['session_id']}").status_code == 200
+
+    assert client.get('/auth/profile').status_code == 302
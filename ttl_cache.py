@@ -0,0 +1,120 @@
+"""
+Thread-safe in-process LRU cache with a TTL and per-key generations.
+
+Used by the per-process caches (user_cache.py, user_sessions.py,
+history_cache.py, journal_cache.py). A loader reads generation(key) before
+querying the database and passes it to put(); invalidate() bumps the
+generation, so a load that raced with a committed write is not stored.
+The TTL bounds how long a value changed by another process is served.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """LRU of values by key, bounded by entry count and optionally by total size"""
+
+    def __init__(self, max_entries, ttl, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()  # key -> [value, expires_at, size]
+        self._bytes = 0
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """The cached value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() > entry[1]:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, key):
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def put(self, key, value, generation):
+        """
+        Store a freshly loaded value unless the key was invalidated since
+        generation() was read. Replacing an unexpired value keeps its expiry,
+        so a write never extends how long this process serves stale data.
+        """
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return
+            previous = self._entries.get(key)
+            if previous is not None and time.monotonic() <= previous[1]:
+                expires_at = previous[1]
+            else:
+                expires_at = time.monotonic() + self.ttl
+            self._remove(key)
+            size = self._sizeof(value)
+            self._entries[key] = [value, expires_at, size]
+            self._bytes += size
+            self._evict()
+
+    def update(self, key, fn):
+        """Apply fn(value) in place to a cached value, and bump the key's generation"""
+        with self._lock:
+            self._bump(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            fn(entry[0])
+            size = self._sizeof(entry[0])
+            self._bytes += size - entry[2]
+            entry[2] = size
+            self._evict()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._bump(key)
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _bump(self, key):
+        # Generations only need to outlive an in-flight load, so the map can
+        # simply be reset when it grows large; a reset makes pending loads skip put().
+        if len(self._generations) > 4 * self.max_entries:
+            self._generations.clear()
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[2]
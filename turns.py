@@ -0,0 +1,267 @@
+"""
+Chat turn execution on a dedicated, bounded worker pool.
+
+A chat turn (store the user message, call the model, store the reply) takes
+seconds of upstream time. Running it here instead of on the waitress thread
+that received the request lets the request return immediately; clients then
+poll the turn (or stream it) while the reply is generated.
+
+Submissions are deduplicated per user: a retry carrying the same
+idempotency key, or the same message sent again while the first is in
+flight or just finished, attaches to the existing turn and gets its result
+instead of calling the model again. Reusing a key for a different message
+is refused.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from models import db, Chat
+from more import stream_response_with_history
+from context import build_context
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds within which an identical message counts as a double-submit
+DUPLICATE_WINDOW = 30
+
+
+class QueueFullError(Exception):
+    """Raised when too many chat turns are already queued or running"""
+
+
+class IdempotencyKeyReusedError(Exception):
+    """Raised when an idempotency key is sent again with a different message"""
+
+
+def is_duplicate_message(user_id, usertext):
+    """Check if this exact message was just sent (prevent duplicates)"""
+    recent_message = db.session.query(Chat.id).filter(
+        Chat.user_id == user_id,
+        Chat.message_hash == Chat.hash_message(usertext),
+        Chat.message_type == 'user',
+        Chat.timestamp >= datetime.utcnow() - timedelta(seconds=DUPLICATE_WINDOW)
+    ).first()
+    return recent_message is not None
+
+
+def run_chat_turn(user_id, usertext, on_delta=None):
+    """
+    Store the user message, stream the model reply and store it.
+
+    Calls on_delta(text) for every token delta. Returns the full reply, or
+    None if the message was a duplicate and nothing was done.
+    """
+    if is_duplicate_message(user_id, usertext):
+        logger.info(f"Duplicate message from user {user_id} skipped")
+        return None
+
+    # Get user's previous conversation context (excluding the current message)
+    conversation = build_context(user_id, usertext)
+
+    # Commit the user message up front so it is kept even if generation fails
+    db.session.add(Chat(
+        user_id=user_id,
+        message=usertext,
+        message_type='user',
+        message_hash=Chat.hash_message(usertext)
+    ))
+    db.session.commit()
+
+    parts = []
+    try:
+        for delta in stream_response_with_history(usertext, conversation.history, conversation.summary):
+            parts.append(delta)
+            if on_delta:
+                on_delta(delta)
+    finally:
+        ai_response = ''.join(parts)
+        if ai_response:
+            try:
+                db.session.add(Chat(
+                    user_id=user_id,
+                    message=ai_response,
+                    message_type='assistant'
+                ))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+    return ai_response
+
+
+class ChatTurn:
+    """State of one submitted chat turn, shared between the worker and pollers"""
+
+    def __init__(self, user_id, usertext, idempotency_key=None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.usertext = usertext
+        self.message_hash = Chat.hash_message(usertext)
+        self.idempotency_key = idempotency_key
+        self.status = 'queued'
+        self.parts = []
+        self.message = None
+        self.error = None
+        self.duplicate = False
+        self.created_at = time.monotonic()
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+    def start(self):
+        with self._cond:
+            self.status = 'running'
+            self._cond.notify_all()
+
+    def append(self, delta):
+        with self._cond:
+            self.parts.append(delta)
+            self._cond.notify_all()
+
+    def finish(self, message=None, error=None):
+        with self._cond:
+            self.message = message
+            self.duplicate = message is None and error is None
+            self.error = error
+            self.status = 'failed' if error else 'done'
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    def wait(self, offset=0, timeout=None):
+        """Block until there is text beyond `offset` or the turn is finished"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.done or len(''.join(self.parts)) > offset, timeout)
+
+    def wait_done(self, timeout=None):
+        """Block until the turn is finished"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def snapshot(self, offset=0):
+        """JSON-ready state; `text` holds only what came after `offset` characters"""
+        with self._cond:
+            text = ''.join(self.parts)
+            return {
+                'turn_id': self.id,
+                'status': self.status,
+                'text': text[offset:],
+                'offset': len(text),
+                'message': self.message,
+                'duplicate': self.duplicate,
+                'error': self.error
+            }
+
+
+class TurnExecutor:
+    """Bounded pool that runs chat turns inside an application context"""
+
+    def __init__(self, app, max_workers, max_pending, result_ttl):
+        self.app = app
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-turn')
+        self._turns = {}
+        self._by_key = {}  # (user_id, idempotency key) -> turn
+        self._by_message = {}  # (user_id, message hash) -> latest turn for that message
+        self._pending = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, usertext, idempotency_key=None):
+        """
+        Queue a chat turn; raises QueueFullError when at capacity.
+
+        Returns the existing turn instead when this user already submitted
+        the same idempotency key, or the same message within
+        DUPLICATE_WINDOW seconds of it finishing. Raises
+        IdempotencyKeyReusedError when the key was used for another message.
+        """
+        turn = ChatTurn(user_id, usertext, idempotency_key)
+        with self._lock:
+            self._purge()
+            existing = self._find(turn)
+            if existing is not None:
+                return existing
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Chat queue is full ({self._pending} turns pending)")
+            self._pending += 1
+            self._turns[turn.id] = turn
+            self._by_message[(user_id, turn.message_hash)] = turn
+            if idempotency_key:
+                self._by_key[(user_id, idempotency_key)] = turn
+        self._pool.submit(self._run, turn)
+        return turn
+
+    def get(self, turn_id, user_id):
+        """Return the turn if it exists and belongs to user_id"""
+        with self._lock:
+            turn = self._turns.get(turn_id)
+        if turn is None or turn.user_id != user_id:
+            return None
+        return turn
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'running': self._running,
+                'queued': self._pending - self._running,
+                'max_pending': self.max_pending
+            }
+
+    def _run(self, turn):
+        with self._lock:
+            self._running += 1
+        turn.start()
+        started = time.monotonic()
+        metrics.CHAT_TURN_WAIT.observe(started - turn.created_at)
+        try:
+            with self.app.app_context():
+                message = run_chat_turn(turn.user_id, turn.usertext, on_delta=turn.append)
+            turn.finish(message=message)
+        except Exception as e:
+            self.app.logger.error(f"Chat turn {turn.id} for user {turn.user_id} failed: {e}")
+            turn.finish(error="Failed to generate a response")
+        finally:
+            status = 'duplicate' if turn.duplicate else turn.status
+            metrics.CHAT_TURN_DURATION.observe(time.monotonic() - started, status=status)
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+
+    def _find(self, turn):
+        if turn.idempotency_key:
+            existing = self._by_key.get((turn.user_id, turn.idempotency_key))
+            if existing is not None:
+                if existing.message_hash != turn.message_hash:
+                    raise IdempotencyKeyReusedError("Idempotency key was already used for a different message")
+                return existing
+        existing = self._by_message.get((turn.user_id, turn.message_hash))
+        # A failed turn is not reused, so resending the message retries it
+        if existing is not None and existing.status != 'failed' and not self._expired(existing, DUPLICATE_WINDOW):
+            return existing
+        return None
+
+    @staticmethod
+    def _expired(turn, ttl):
+        return turn.finished_at is not None and time.monotonic() - turn.finished_at > ttl
+
+    def _purge(self):
+        # Finished turns are kept briefly so late pollers still get the result
+        expired = [turn_id for turn_id, turn in self._turns.items() if self._expired(turn, self.result_ttl)]
+        for turn_id in expired:
+            turn = self._turns.pop(turn_id)
+            self._by_key.pop((turn.user_id, turn.idempotency_key), None)
+        for key, turn in list(self._by_message.items()):
+            if self._expired(turn, DUPLICATE_WINDOW):
+                del self._by_message[key]
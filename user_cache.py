@@ -0,0 +1,70 @@
+"""
+In-process cache of logged-in user identities for Flask-Login.
+
+The user loader runs on every authenticated request. Instead of loading the
+User row each time, it returns a detached, read-only snapshot cached for
+USER_CACHE_TTL seconds. Snapshots are dropped when a transaction that
+changed or deleted the user commits (profile update, password change,
+deactivation, last login) and on logout; changes made by another process
+are picked up when the TTL expires.
+
+Code that modifies a user must load the ORM object with db.session.get()
+rather than modify current_user.
+"""
+
+from flask_login import UserMixin
+
+from config import Config
+from models import db, User
+from session_events import on_commit
+from ttl_cache import TTLCache
+
+SNAPSHOT_FIELDS = ('id', 'username', 'is_active', 'is_admin', 'created_at', 'last_login')
+
+
+class UserSnapshot(UserMixin):
+    """Read-only copy of a User row that is safe to share between requests"""
+
+    __slots__ = SNAPSHOT_FIELDS
+
+    def __init__(self, user):
+        for field in SNAPSHOT_FIELDS:
+            object.__setattr__(self, field, getattr(user, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"UserSnapshot is read-only; load the User with db.session.get() to change {name}")
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.username}>'
+
+
+cache = TTLCache(max_entries=Config.USER_CACHE_MAX_USERS, ttl=Config.USER_CACHE_TTL)
+
+
+def load_identity(user_id):
+    """Return the cached snapshot for user_id, loading it on a miss; None if there is no such user"""
+    snapshot = cache.get(user_id)
+    if snapshot is None:
+        generation = cache.generation(user_id)
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user)
+        cache.put(user_id, snapshot, generation)
+    return snapshot
+
+
+# --- invalidation from the ORM session --------------------------------------
+
+def _collect_changes(session, pending):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            pending.add(obj.id)
+
+
+def _apply_changes(pending):
+    for user_id in pending:
+        cache.invalidate(user_id)
+
+
+on_commit('user_cache', _collect_changes, _apply_changes)
@@ -0,0 +1,168 @@
+"""
+Server-side validation of login sessions.
+
+Login stores the UserSession id in the Flask session; every authenticated
+request checks that the row is still active and unexpired. Sessions expire
+after SESSION_IDLE_TIMEOUT without activity (REMEMBER_COOKIE_DURATION for
+"remember me" logins), and a user restored from Flask-Login's remember
+cookie gets a fresh session. Lookups are
+cached for SESSION_CACHE_TTL seconds, and a commit that revokes or deletes
+a session drops it from this process's cache at once, so revocation takes
+effect immediately here and within the TTL in other processes.
+
+A background sweeper deletes expired and revoked rows in bounded batches
+so the table only holds live sessions.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import request, session
+from sqlalchemy import or_
+
+from config import Config
+from models import db, UserSession
+from session_events import on_commit
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SessionState = namedtuple('SessionState', ['user_id', 'is_active', 'expires_at'])
+
+# Cached for ids with no row, so a revoked-and-swept session stays cheap to reject
+MISSING = SessionState(None, False, datetime.min)
+
+
+cache = TTLCache(max_entries=Config.SESSION_CACHE_MAX_ENTRIES, ttl=Config.SESSION_CACHE_TTL)
+
+
+def load_session_state(session_id):
+    state = cache.get(session_id)
+    if state is None:
+        generation = cache.generation(session_id)
+        row = db.session.query(
+            UserSession.user_id, UserSession.is_active, UserSession.expires_at
+        ).filter(UserSession.id == session_id).first()
+        state = SessionState(*row) if row is not None else MISSING
+        cache.put(session_id, state, generation)
+    return state
+
+
+def is_session_valid(session_id, user_id):
+    """True if session_id belongs to user_id and is active and unexpired"""
+    if not session_id:
+        return False
+    state = load_session_state(session_id)
+    return state.user_id == user_id and bool(state.is_active) and state.expires_at > datetime.utcnow()
+
+
+def start_session(user_id, remember=False):
+    """Add a new UserSession for user_id to the database session; the caller commits"""
+    lifetime = Config.REMEMBER_COOKIE_DURATION if remember else Config.SESSION_IDLE_TIMEOUT
+    user_session = UserSession(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(seconds=lifetime),
+        ip_address=request.remote_addr,
+        user_agent=request.headers.get('User-Agent')
+    )
+    db.session.add(user_session)
+    return user_session
+
+
+def resume_remembered_session(sender, user):
+    """
+    Flask-Login user_loaded_from_cookie handler: the browser dropped its
+    session cookie but kept the remember cookie, so start a new session
+    instead of logging the user out.
+    """
+    try:
+        user_session = start_session(user.id, remember=True)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not resume remembered session for user {user.id}: {e}")
+        return
+    session['session_id'] = user_session.id
+
+
+def extend_session(session_id):
+    """Push an active session's expiry SESSION_IDLE_TIMEOUT ahead once less than half of it is left"""
+    idle_timeout = timedelta(seconds=Config.SESSION_IDLE_TIMEOUT)
+    now = datetime.utcnow()
+    if load_session_state(session_id).expires_at - now >= idle_timeout / 2:
+        return
+    try:
+        user_session = db.session.get(UserSession, session_id)
+        if user_session is not None and user_session.expires_at < now + idle_timeout:
+            user_session.expires_at = now + idle_timeout
+            db.session.commit()
+    except Exception as e:
+        # The session is still valid; the next request tries again
+        db.session.rollback()
+        logger.warning(f"Could not extend session {session_id}: {e}")
+
+
+def sweep_expired_sessions(batch_size=None):
+    """
+    Delete expired and revoked sessions, batch_size rows per transaction.
+
+    Must be called inside an application context. Returns the number of
+    rows deleted.
+    """
+    batch_size = batch_size or Config.SESSION_SWEEP_BATCH_SIZE
+    deleted = 0
+    while True:
+        ids = [row.id for row in db.session.query(UserSession.id).filter(or_(
+            UserSession.expires_at < datetime.utcnow(),
+            UserSession.is_active.is_(False)
+        )).limit(batch_size)]
+        if not ids:
+            break
+        # Bulk deletes skip the session events; that is fine because any
+        # cached state of these rows is already expired or inactive
+        db.session.query(UserSession).filter(UserSession.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
+
+
+def session_sweeper(app):
+    """Background loop that runs sweep_expired_sessions every SESSION_SWEEP_INTERVAL seconds"""
+    while True:
+        try:
+            with app.app_context():
+                deleted = sweep_expired_sessions()
+                if deleted:
+                    logger.info(f"Deleted {deleted} expired or revoked sessions")
+        except Exception as e:
+            logger.error(f"Error sweeping sessions: {e}")
+        time.sleep(Config.SESSION_SWEEP_INTERVAL)
+
+
+def start_session_sweeper(app):
+    thread = threading.Thread(target=session_sweeper, args=(app,), daemon=True, name='session-sweeper')
+    thread.start()
+    return thread
+
+
+# --- invalidation from the ORM session --------------------------------------
+
+def _collect_changes(session, pending):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, UserSession):
+            pending.add(obj.id)
+
+
+def _apply_changes(pending):
+    for session_id in pending:
+        cache.invalidate(session_id)
+
+
+on_commit('user_sessions', _collect_changes, _apply_changes)